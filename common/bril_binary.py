@@ -0,0 +1,347 @@
+import json
+import mmap
+import struct
+import unittest
+
+from bril_ir import Opcode, OPCODE_OF, OP_NAME
+
+# Compact binary encoding of Bril programs, as an alternative to JSON between pipeline stages.
+#
+# Layout (all integers little-endian):
+#   magic            b"BRILBIN\x01"
+#   function records one after the other, see `encode_function`
+#   string table     u32 count, (count + 1) u32 offsets into the UTF-8 blob, the blob
+#   function index   u64 offset of each function record
+#   trailer          `_TRAILER`: string table offset, index offset, number of functions,
+#                    string holding the other top-level keys of the program (as JSON), magic
+#
+# Every variable, label, function name and type is interned in the string table and
+# referred to by its u32 index, and opcodes are small integers (`bril_ir.Opcode`). The string table
+# and the index are at the end so a program can be written one function at a time;
+# readers jump to them from the trailer, and only decode the functions they ask for.
+#
+# Decoding gives back the same program (with the keys of each object in sorted order, like `bril2json`):
+# anything the fixed-width fields can't represent (unknown opcodes, extra keys such as "pos",
+# huge or unusual values) is kept as a JSON string next to the instruction.
+
+MAGIC = b"BRILBIN\x01"
+_TRAILER = struct.Struct("<QQII4s")
+_TRAILER_MAGIC = b"BRLE"
+
+# No string (absent field)
+NONE = 0xFFFFFFFF
+
+# Instruction record: opcode, value kind, flags, dest (or label name), type, value,
+# extra keys (JSON), number of args, funcs and labels
+_INSTR = struct.Struct("<HBBIIqIHHH")
+# Function record header: name, return type, extra keys (JSON), flags, number of args, of instructions
+# and of operands. It is followed by a (name, type) pair of u32 string indices per argument, the
+# instruction records, and the u32 string indices of the args, funcs and labels of all instructions
+_FUNC = struct.Struct("<IIIIIII")
+
+# Flags: which of the list fields are present (possibly empty)
+HAS_ARGS, HAS_FUNCS, HAS_LABELS = 1, 2, 4
+
+# Value kinds
+VALUE_NONE, VALUE_INT, VALUE_BOOL, VALUE_FLOAT, VALUE_STR = range(5)
+
+_STANDARD_INSTR_KEYS = frozenset(("op", "dest", "type", "args", "funcs", "labels", "value"))
+_STANDARD_FUNC_KEYS = frozenset(("name", "args", "type", "instrs"))
+_I64_MIN, _I64_MAX = -(1 << 63), (1 << 63) - 1
+_F64 = struct.Struct("<d")
+_Q = struct.Struct("<q")
+
+
+class StringTable:
+    """Interned strings, numbered in order of first appearance"""
+
+    def __init__(self):
+        self.index: dict[str, int] = {}
+        self.strings: list[str] = []
+
+    def intern(self, s: str) -> int:
+        i = self.index.get(s)
+        if i is None:
+            i = self.index[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def intern_type(self, t) -> int:
+        # Types are strings or (nested) objects like {"ptr": "int"}; keep the latter as JSON
+        return self.intern(t) if isinstance(t, str) else self.intern("\0" + json.dumps(t))
+
+    def encode(self) -> bytes:
+        blobs = [s.encode("utf-8") for s in self.strings]
+        offsets = [0]
+        for b in blobs:
+            offsets.append(offsets[-1] + len(b))
+        return struct.pack(f"<I{len(offsets)}I", len(self.strings), *offsets) + b"".join(blobs)
+
+
+def _encode_instr(instr: dict, strings: StringTable, out: list, operands: list) -> None:
+    op = instr.get("op")
+    if op is None and "label" in instr:
+        opcode, dest, extra_keys = Opcode.LABEL, strings.intern(instr["label"]), [k for k in instr if k != "label"]
+    elif op in OPCODE_OF:
+        opcode, dest = OPCODE_OF[op], strings.intern(instr["dest"]) if "dest" in instr else NONE
+        extra_keys = [k for k in instr if k not in _STANDARD_INSTR_KEYS]
+    else:
+        opcode, dest, extra_keys = Opcode.OTHER, NONE, list(instr)
+
+    if opcode == Opcode.OTHER:
+        extra = strings.intern(json.dumps(instr))
+        out.append(_INSTR.pack(opcode, VALUE_NONE, 0, NONE, NONE, 0, extra, 0, 0, 0))
+        return
+
+    kind, value = VALUE_NONE, 0
+    if "value" in instr:
+        v = instr["value"]
+        if type(v) is bool:
+            kind, value = VALUE_BOOL, int(v)
+        elif type(v) is int and _I64_MIN <= v <= _I64_MAX:
+            kind, value = VALUE_INT, v
+        elif type(v) is float:
+            kind, value = VALUE_FLOAT, _Q.unpack(_F64.pack(v))[0]
+        elif type(v) is str:
+            kind, value = VALUE_STR, strings.intern(v)
+        else:
+            extra_keys.append("value")
+    extra = strings.intern(json.dumps({k: instr[k] for k in extra_keys})) if extra_keys else NONE
+    type_ = strings.intern_type(instr["type"]) if "type" in instr else NONE
+
+    flags = 0
+    counts = []
+    for flag, key in ((HAS_ARGS, "args"), (HAS_FUNCS, "funcs"), (HAS_LABELS, "labels")):
+        names = instr.get(key) if opcode != Opcode.LABEL else None
+        if names is not None:
+            flags |= flag
+            operands.extend(strings.intern(name) for name in names)
+        counts.append(len(names) if names is not None else 0)
+    out.append(_INSTR.pack(opcode, kind, flags, dest, type_, value, extra, *counts))
+
+
+def encode_function(func: dict, strings: StringTable) -> bytes:
+    """Binary record of one function (its strings are added to `strings`)"""
+    args = func.get("args")
+    flags = 0
+    extra_keys = [k for k in func if k not in _STANDARD_FUNC_KEYS]
+    if args is not None:
+        if all(set(arg) == {"name", "type"} for arg in args):
+            flags |= HAS_ARGS
+        else:
+            extra_keys.append("args")
+            args = None
+    extra = strings.intern(json.dumps({k: func[k] for k in extra_keys})) if extra_keys else NONE
+    ret = strings.intern_type(func["type"]) if "type" in func else NONE
+    name = strings.intern(func["name"])
+    arg_strings = [i for arg in args or () for i in (strings.intern(arg["name"]), strings.intern_type(arg["type"]))]
+    records, operands = [], []
+    for instr in func.get("instrs", []):
+        _encode_instr(instr, strings, records, operands)
+    header = _FUNC.pack(name, ret, extra, flags, len(args or ()), len(records), len(operands))
+    return b"".join((header, struct.pack(f"<{len(arg_strings)}I", *arg_strings), *records,
+                     struct.pack(f"<{len(operands)}I", *operands)))
+
+
+class BinaryProgramWriter:
+    """Writes a binary program to a binary stream one function at a time"""
+
+    def __init__(self, out):
+        self.out = out
+        self.strings = StringTable()
+        self.offsets: list[int] = []
+        self.position = len(MAGIC)
+        out.write(MAGIC)
+
+    def write(self, func: dict) -> None:
+        record = encode_function(func, self.strings)
+        self.offsets.append(self.position)
+        self.out.write(record)
+        self.position += len(record)
+
+    def close(self, extras: dict | None = None) -> None:
+        """Writes the string table, the function index and the trailer.
+        `extras` are the top-level keys of the program other than "functions\""""
+        extra = self.strings.intern(json.dumps(extras)) if extras else NONE
+        table = self.strings.encode()
+        strtab_offset = self.position
+        index_offset = strtab_offset + len(table)
+        self.out.write(table)
+        self.out.write(struct.pack(f"<{len(self.offsets)}Q", *self.offsets))
+        self.out.write(_TRAILER.pack(strtab_offset, index_offset, len(self.offsets), extra, _TRAILER_MAGIC))
+        self.out.flush()
+
+
+class BinaryProgram:
+    """A binary program, read from a buffer (e.g. an `mmap`). Only the trailer and the
+    function index are read upfront; strings and functions are decoded when they're needed"""
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        if bytes(self.data[:len(MAGIC)]) != MAGIC or len(self.data) < len(MAGIC) + _TRAILER.size:
+            raise ValueError("not a binary Bril program")
+        strtab_offset, index_offset, n, extra, magic = _TRAILER.unpack_from(self.data, len(self.data) - _TRAILER.size)
+        if magic != _TRAILER_MAGIC:
+            raise ValueError("truncated binary Bril program")
+        self.offsets = list(struct.unpack_from(f"<{n}Q", self.data, index_offset)) + [strtab_offset]
+        count, = struct.unpack_from("<I", self.data, strtab_offset)
+        self._string_offsets = struct.unpack_from(f"<{count + 1}I", self.data, strtab_offset + 4)
+        self._blob = strtab_offset + 4 * (count + 2)
+        self._strings: list[str | None] = [None] * count
+        self._types: dict[int, object] = {}
+        self.extras = json.loads(self.string(extra)) if extra != NONE else {}
+
+    @classmethod
+    def from_file(cls, f) -> "BinaryProgram":
+        """Maps a (binary) file into memory, or reads it if it can't be mapped (e.g. a pipe)"""
+        try:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError, AttributeError):
+            return cls(f.read())
+
+    def string(self, i: int) -> str:
+        s = self._strings[i]
+        if s is None:
+            start, end = self._string_offsets[i], self._string_offsets[i + 1]
+            s = self._strings[i] = str(self.data[self._blob + start:self._blob + end], "utf-8")
+        return s
+
+    def type(self, i: int):
+        t = self._types.get(i)
+        if t is None:
+            s = self.string(i)
+            t = self._types[i] = json.loads(s[1:]) if s.startswith("\0") else s
+        # Object types are mutable, so hand out copies
+        return t if isinstance(t, str) else json.loads(json.dumps(t))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def function(self, f: int) -> dict:
+        """Decodes the `f`-th function"""
+        data, string = self.data, self.string
+        pos = self.offsets[f]
+        name, ret, extra, flags, nargs, ninstrs, noperands = _FUNC.unpack_from(data, pos)
+        pos += _FUNC.size
+        func = {}
+        if flags & HAS_ARGS:
+            pairs = struct.unpack_from(f"<{2 * nargs}I", data, pos)
+            func["args"] = [{"name": string(pairs[i]), "type": self.type(pairs[i + 1])} for i in range(0, len(pairs), 2)]
+        pos += 8 * nargs
+        records = _INSTR.iter_unpack(data[pos:pos + ninstrs * _INSTR.size])
+        operands = struct.unpack_from(f"<{noperands}I", data, pos + ninstrs * _INSTR.size)
+        instrs = func["instrs"] = []
+        func["name"] = string(name)
+        if ret != NONE:
+            func["type"] = self.type(ret)
+        if extra != NONE:
+            func.update(json.loads(string(extra)))
+
+        o = 0
+        label, other = int(Opcode.LABEL), int(Opcode.OTHER)
+        for opcode, kind, flags, dest, type_, value, extra, nargs, nfuncs, nlabels in records:
+            if opcode == label:
+                instr = {"label": string(dest)}
+            elif opcode == other:
+                instrs.append(json.loads(string(extra)))
+                continue
+            else:
+                # Keys in sorted order
+                instr = {}
+                if flags & HAS_ARGS:
+                    instr["args"] = [string(i) for i in operands[o:o + nargs]]
+                o += nargs
+                if dest != NONE:
+                    instr["dest"] = string(dest)
+                if flags & HAS_FUNCS:
+                    instr["funcs"] = [string(i) for i in operands[o:o + nfuncs]]
+                o += nfuncs
+                if flags & HAS_LABELS:
+                    instr["labels"] = [string(i) for i in operands[o:o + nlabels]]
+                o += nlabels
+                instr["op"] = OP_NAME[opcode]
+                if type_ != NONE:
+                    instr["type"] = self.type(type_)
+                if kind == VALUE_INT:
+                    instr["value"] = value
+                elif kind == VALUE_BOOL:
+                    instr["value"] = bool(value)
+                elif kind == VALUE_FLOAT:
+                    instr["value"] = _F64.unpack(_Q.pack(value))[0]
+                elif kind == VALUE_STR:
+                    instr["value"] = string(value)
+            if extra != NONE:
+                instr.update(json.loads(string(extra)))
+            instrs.append(instr)
+        return func
+
+    def functions(self):
+        """Decodes the functions one at a time"""
+        for f in range(len(self)):
+            yield self.function(f)
+
+    def to_json(self) -> dict:
+        return {"functions": list(self.functions())} | self.extras
+
+
+def encode_program(program: dict) -> bytes:
+    import io
+
+    out = io.BytesIO()
+    writer = BinaryProgramWriter(out)
+    for func in program["functions"]:
+        writer.write(func)
+    writer.close({k: v for k, v in program.items() if k != "functions"})
+    return out.getvalue()
+
+
+def decode_program(data) -> dict:
+    return BinaryProgram(data).to_json()
+
+
+class TestBinaryFormat(unittest.TestCase):
+    program = {"functions": [
+        {"name": "main", "args": [{"name": "n", "type": "int"}, {"name": "p", "type": {"ptr": "float"}}], "instrs": [
+            {"dest": "one", "op": "const", "type": "int", "value": 1},
+            {"dest": "t", "op": "const", "type": "bool", "value": True},
+            {"dest": "f", "op": "const", "type": "float", "value": 1.5},
+            {"dest": "c", "op": "const", "type": "char", "value": "ü"},
+            {"dest": "big", "op": "const", "type": "int", "value": 1 << 70},
+            {"label": "loop"},
+            {"args": ["t"], "labels": ["loop", "done"], "op": "br"},
+            {"label": "done", "pos": {"row": 3, "col": 1}},
+            {"args": ["n", "one"], "dest": "r", "funcs": ["f"], "op": "call", "type": "int"},
+            {"args": [], "op": "print"},
+            {"op": "ret"},
+            {"op": "frobnicate", "weird": [1, 2]},
+        ]},
+        {"name": "f", "type": "int", "args": [{"name": "x", "type": "int", "note": "extra key"}], "instrs": []},
+    ], "imports": []}
+
+    def test_round_trip(self):
+        data = encode_program(self.program)
+        self.assertEqual(decode_program(data), self.program)
+        # Values keep their exact types
+        instrs = decode_program(data)["functions"][0]["instrs"]
+        self.assertIs(instrs[1]["value"], True)
+        self.assertIs(type(instrs[0]["value"]), int)
+
+    def test_lazy_access(self):
+        program = BinaryProgram(encode_program(self.program))
+        self.assertEqual(len(program), 2)
+        self.assertEqual(program.function(1), self.program["functions"][1])
+        # Only the strings of the decoded function were decoded
+        self.assertIn(None, program._strings)
+
+    def test_opcodes(self):
+        self.assertEqual(OPCODE_OF["ptradd"], Opcode.PTRADD)
+        self.assertEqual(OP_NAME[Opcode.CHAR2INT], "char2int")
+        self.assertNotIn("label", OPCODE_OF)
+
+    def test_rejects_other_data(self):
+        with self.assertRaises(ValueError):
+            BinaryProgram(b'{"functions": []}' + bytes(32))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,238 @@
+import argparse
+import functools
+import io
+import json
+import sys
+import unittest
+
+from bril_binary import BinaryProgram, BinaryProgramWriter
+from parallel import imap_functions
+
+# Reading and writing Bril programs one function at a time, as JSON or in the binary format
+# of `bril_binary.py`, so a pass only ever holds one function (and its rewritten copy) in memory:
+#
+#     reader = program_reader(sys.stdin, args.in_format)
+#     writer = program_writer(sys.stdout, args.out_format)
+#     for func in reader.functions():
+#         writer.write(transform(func))
+#     writer.close(reader.extras)
+
+FORMATS = ("json", "bin")
+
+
+def add_format_arguments(parser: argparse.ArgumentParser, output: bool = True) -> None:
+    """Adds the `--in-format` (and `--out-format`) options to an `argparse` parser"""
+    parser.add_argument("--in-format", choices=FORMATS, default="json", help="Format of the program read from stdin")
+    if output:
+        parser.add_argument("--out-format", choices=FORMATS, default="json", help="Format of the program written to stdout")
+
+
+class JSONProgramReader:
+    """Parses the functions of a JSON program from a text stream one at a time.
+    The other top-level keys are collected in `extras` (complete once all functions were read)"""
+
+    def __init__(self, stream, chunk_size: int = 1 << 16):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.extras: dict = {}
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, at_least: int) -> bool:
+        """Reads at least `at_least` more characters (unless the stream ends). Returns False at the end of the stream"""
+        if self.eof:
+            return False
+        # Drop what was already parsed
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        target = len(self.buf) + at_least
+        while len(self.buf) < target:
+            chunk = self.stream.read(max(self.chunk_size, target - len(self.buf)))
+            if not chunk:
+                self.eof = True
+                break
+            self.buf += chunk
+        return True
+
+    def _peek(self) -> str:
+        """The next non-whitespace character ("" at the end of the stream)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill(self.chunk_size):
+                return self.buf[self.pos:self.pos + 1]
+
+    def _expect(self, chars: str) -> str:
+        c = self._peek()
+        if not c or c not in chars:
+            raise ValueError(f"malformed Bril program: expected one of {chars!r}, got {c!r}")
+        self.pos += 1
+        return c
+
+    def _value(self):
+        """Parses the next JSON value, reading more of the stream until it is complete"""
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Incomplete: read (at least) as much again, so parsing stays linear overall
+                if not self._fill(max(self.chunk_size, len(self.buf) - self.pos)):
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self.buf) and self._fill(self.chunk_size):
+                continue
+            self.pos = end
+            return value
+
+    def functions(self):
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key == "functions":
+                self._expect("[")
+                if self._peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._expect(",]") == "]":
+                            break
+            else:
+                self.extras[key] = self._value()
+            if self._expect(",}") == "}":
+                return
+
+
+class JSONProgramWriter:
+    """Writes a JSON program one function at a time. The output is the same as
+    `json.dump(program, out, indent=2)` when "functions" is the first key of `program`"""
+
+    def __init__(self, out):
+        self.out = out
+        self.count = 0
+        out.write('{\n  "functions": [')
+
+    def write(self, func: dict) -> None:
+        self.out.write(",\n    " if self.count else "\n    ")
+        self.out.write(json.dumps(func, indent=2).replace("\n", "\n    "))
+        self.count += 1
+
+    def close(self, extras: dict | None = None) -> None:
+        self.out.write("\n  ]" if self.count else "]")
+        for key, value in (extras or {}).items():
+            self.out.write(f",\n  {json.dumps(key)}: {json.dumps(value, indent=2).replace(chr(10), chr(10) + '  ')}")
+        self.out.write("\n}")
+        self.out.flush()
+
+
+def program_reader(stream, fmt: str = "json"):
+    """Reader with a `functions()` generator and the other top-level keys in `extras`.
+    `stream` is a text stream (e.g. `sys.stdin`); binary programs are read from its underlying buffer"""
+    if fmt == "bin":
+        return BinaryProgram.from_file(getattr(stream, "buffer", stream))
+    return JSONProgramReader(stream)
+
+
+def program_writer(stream, fmt: str = "json"):
+    """Writer with `write(func)` and `close(extras)` methods"""
+    if fmt == "bin":
+        return BinaryProgramWriter(getattr(stream, "buffer", stream))
+    return JSONProgramWriter(stream)
+
+
+def load_program(stream, fmt: str = "json") -> dict:
+    """The whole program, for tools that need all of it at once"""
+    reader = program_reader(stream, fmt)
+    functions = list(reader.functions())
+    return {"functions": functions} | reader.extras
+
+
+def _with_instrs(instrs_fn, func: dict) -> dict:
+    return {**func, "instrs": instrs_fn(func)}
+
+
+def stream_program(instrs_fn, args: argparse.Namespace, stdin=sys.stdin, stdout=sys.stdout) -> None:
+    """Reads a program from `stdin` and writes it to `stdout`, replacing the instructions of each function `f`
+    by `instrs_fn(f)`, one function at a time. `args` holds the `--in-format`/`--out-format` options,
+    and `--jobs` (if it was added) to spread the functions over worker processes"""
+    reader = program_reader(stdin, args.in_format)
+    writer = program_writer(stdout, args.out_format)
+    jobs = getattr(args, "jobs", 1)
+    for func in imap_functions(functools.partial(_with_instrs, instrs_fn), reader.functions(), jobs):
+        writer.write(func)
+    writer.close(reader.extras)
+
+
+def _reversed_instrs(func: dict) -> list[dict]:
+    return func["instrs"][::-1]
+
+
+class TestBrilIO(unittest.TestCase):
+    program = {
+        "functions": [
+            {"name": "main", "instrs": [{"dest": "x", "op": "const", "type": "int", "value": 12345},
+                                        {"args": ["x"], "op": "print"}]},
+            {"args": [{"name": "a", "type": "float"}], "name": "f", "instrs": [{"op": "ret", "args": ["a"]}], "type": "float"},
+        ],
+        "imports": [{"path": "lib.bril", "functions": [{"name": "g"}]}],
+    }
+
+    def test_json_writer_matches_json_dump(self):
+        for program in (self.program, {"functions": []}):
+            out = io.StringIO()
+            writer = program_writer(out, "json")
+            for func in program["functions"]:
+                writer.write(func)
+            writer.close({k: v for k, v in program.items() if k != "functions"})
+            self.assertEqual(out.getvalue(), json.dumps(program, indent=2))
+
+    def test_streaming_reader(self):
+        text = json.dumps(self.program, indent=2)
+        for chunk_size in (1, 3, 17, 1 << 16):
+            reader = JSONProgramReader(io.StringIO(text), chunk_size=chunk_size)
+            self.assertEqual(list(reader.functions()), self.program["functions"])
+            self.assertEqual(reader.extras, {"imports": self.program["imports"]})
+
+    def test_reader_is_lazy(self):
+        # The second function is garbage, but the first one can be read before noticing
+        reader = JSONProgramReader(io.StringIO('{"functions": [{"name": "main"}, {"name": ]}'), chunk_size=1)
+        functions = reader.functions()
+        self.assertEqual(next(functions), {"name": "main"})
+        with self.assertRaises(ValueError):
+            next(functions)
+
+    def test_stream_program(self):
+        args = argparse.Namespace(in_format="json", out_format="bin")
+        out = io.BytesIO()
+        stream_program(_reversed_instrs, args, io.StringIO(json.dumps(self.program)), out)
+        program = load_program(io.BytesIO(out.getvalue()), "bin")
+        self.assertEqual([f["instrs"] for f in program["functions"]], [f["instrs"][::-1] for f in self.program["functions"]])
+        self.assertEqual(program["imports"], self.program["imports"])
+
+    def test_binary_streams(self):
+        out = io.BytesIO()
+        writer = program_writer(out, "bin")
+        for func in self.program["functions"]:
+            writer.write(func)
+        writer.close({"imports": self.program["imports"]})
+        self.assertEqual(load_program(io.BytesIO(out.getvalue()), "bin"), self.program)
+
+
+if __name__ == "__main__":
+    # Converts a program between formats, e.g. `python bril_io.py --out-format bin < prog.json > prog.brb`
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--test", action="store_true", help="Runs unit tests")
+    add_format_arguments(parser)
+    args = parser.parse_args()
+    if args.test:
+        unittest.main(argv=["first-arg-is-ignored"])
+
+    stream_program(lambda func: func["instrs"], args)
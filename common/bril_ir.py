@@ -0,0 +1,361 @@
+import sys
+import unittest
+from enum import IntEnum
+
+# Compact in-memory representation of Bril functions for passes that loop over instructions a lot.
+#
+# An `Instr` is a slotted object instead of a JSON dict: its opcode is a small int (`Opcode`),
+# variables are ints numbered per function (`Function.vars`), and whether it is a terminator,
+# defines a variable or is pure is worked out once, when it's built. Passes compare ints instead
+# of strings (`instr.op == Opcode.JMP` instead of `instr["op"] == "jmp"`), and can index lists
+# by variable instead of hashing names.
+#
+# Converting from and to JSON happens at the edges of a pass (`Function.from_json`, `Function.to_json`).
+# With `keep_source=True`, each instruction keeps the dict it was read from, and instructions
+# that weren't rewritten are handed back as that same dict instead of being converted again.
+# Other keys of an instruction (e.g. source positions, `pos`) are kept in `extras`, and survive rewrites.
+
+
+class Opcode(IntEnum):
+    """Bril opcodes (core, SSA, memory, floating point, speculation and char extensions)"""
+    LABEL = 0
+    CONST = 1
+    ADD = 2
+    MUL = 3
+    SUB = 4
+    DIV = 5
+    EQ = 6
+    LT = 7
+    GT = 8
+    LE = 9
+    GE = 10
+    NOT = 11
+    AND = 12
+    OR = 13
+    JMP = 14
+    BR = 15
+    CALL = 16
+    RET = 17
+    ID = 18
+    PRINT = 19
+    NOP = 20
+    PHI = 21
+    SET = 22
+    GET = 23
+    UNDEF = 24
+    ALLOC = 25
+    FREE = 26
+    STORE = 27
+    LOAD = 28
+    PTRADD = 29
+    FADD = 30
+    FMUL = 31
+    FSUB = 32
+    FDIV = 33
+    FEQ = 34
+    FLT = 35
+    FLE = 36
+    FGT = 37
+    FGE = 38
+    SPECULATE = 39
+    COMMIT = 40
+    GUARD = 41
+    CEQ = 42
+    CLT = 43
+    CLE = 44
+    CGT = 45
+    CGE = 46
+    CHAR2INT = 47
+    INT2CHAR = 48
+    # Any other operation (kept by name)
+    OTHER = 0xFFFF
+
+
+OPCODE_OF = {op.name.lower(): op for op in Opcode if op not in (Opcode.LABEL, Opcode.OTHER)}
+OP_NAME = {op: name for name, op in OPCODE_OF.items()}
+
+TERMINATORS = frozenset((Opcode.JMP, Opcode.BR, Opcode.RET))
+
+# Operations whose result only depends on their arguments, and that have no other effect than
+# defining their destination: they can be removed when it's unused, or reused instead of recomputed.
+# (Division by zero is an error in Bril, like in the other passes it isn't treated as an effect)
+PURE = frozenset((
+    Opcode.CONST, Opcode.ADD, Opcode.MUL, Opcode.SUB, Opcode.DIV,
+    Opcode.EQ, Opcode.LT, Opcode.GT, Opcode.LE, Opcode.GE,
+    Opcode.NOT, Opcode.AND, Opcode.OR, Opcode.ID, Opcode.PTRADD,
+    Opcode.FADD, Opcode.FMUL, Opcode.FSUB, Opcode.FDIV,
+    Opcode.FEQ, Opcode.FLT, Opcode.FLE, Opcode.FGT, Opcode.FGE,
+    Opcode.CEQ, Opcode.CLT, Opcode.CLE, Opcode.CGT, Opcode.CGE,
+    Opcode.CHAR2INT, Opcode.INT2CHAR, Opcode.PHI, Opcode.UNDEF,
+))
+
+# `Instr.flags` bits
+IS_TERMINATOR, HAS_DEST, IS_PURE = 1, 2, 4
+
+# No destination variable
+NO_DEST = -1
+
+# Keys of an instruction that are represented by `Instr` fields
+_FIELDS = frozenset(("op", "label", "dest", "type", "args", "funcs", "labels", "value"))
+
+
+class VarTable:
+    """Dense numbering of the variable names of a function"""
+
+    __slots__ = ("names", "index")
+
+    def __init__(self):
+        self.names: list[str] = []
+        self.index: dict[str, int] = {}
+
+    def id(self, name: str) -> int:
+        v = self.index.get(name)
+        if v is None:
+            v = self.index[name] = len(self.names)
+            self.names.append(sys.intern(name))
+        return v
+
+    def fresh(self, prefix: str) -> int:
+        """A new variable whose name starts with `prefix` and isn't used yet"""
+        n = len(self.names)
+        while f"{prefix}{n}" in self.index:
+            n += 1
+        return self.id(f"{prefix}{n}")
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+class Instr:
+    """A Bril instruction or label. `dest` and `args` are variable ids (`NO_DEST` when there's no destination),
+    `args`, `funcs` and `labels` are `None` when the instruction has no such field, and a label is
+    an instruction with opcode `Opcode.LABEL` whose name is `labels[0]`. Any other keys of the JSON
+    instruction are kept as they are in `extras` (`None` if there are none).
+    Instructions are meant to be treated as immutable: `replace` returns a rewritten copy"""
+
+    __slots__ = ("op", "opname", "dest", "type", "args", "funcs", "labels", "value", "flags", "extras", "source")
+
+    def __init__(self, op: int, dest: int = NO_DEST, type=None, args: tuple | None = None,
+                 funcs: tuple | None = None, labels: tuple | None = None, value=None,
+                 opname: str | None = None, extras: dict | None = None, source: dict | None = None):
+        self.op = op
+        self.opname = opname if opname is not None else OP_NAME.get(op)
+        self.dest = dest
+        self.type = type
+        self.args = args
+        self.funcs = funcs
+        self.labels = labels
+        self.value = value
+        self.extras = extras
+        self.source = source
+        self.flags = ((IS_TERMINATOR if op in TERMINATORS else 0)
+                      | (HAS_DEST if dest != NO_DEST else 0)
+                      | (IS_PURE if op in PURE else 0))
+
+    @classmethod
+    def label(cls, name: str) -> "Instr":
+        return cls(Opcode.LABEL, labels=(sys.intern(name),))
+
+    @property
+    def is_label(self) -> bool:
+        return self.op == Opcode.LABEL
+
+    @property
+    def is_terminator(self) -> bool:
+        return bool(self.flags & IS_TERMINATOR)
+
+    @property
+    def has_dest(self) -> bool:
+        return bool(self.flags & HAS_DEST)
+
+    @property
+    def is_pure(self) -> bool:
+        return bool(self.flags & IS_PURE)
+
+    def replace(self, **changes) -> "Instr":
+        """A copy of this instruction with the given fields changed (and no source dict)"""
+        fields = {"op": self.op, "dest": self.dest, "type": self.type, "args": self.args, "funcs": self.funcs,
+                  "labels": self.labels, "value": self.value, "extras": self.extras}
+        fields.update(changes)
+        if "op" not in changes:
+            fields["opname"] = self.opname
+        return Instr(**fields)
+
+    @classmethod
+    def from_json(cls, instr: dict, variables: VarTable, keep_source: bool = False) -> "Instr":
+        source = instr if keep_source else None
+        extras = {k: v for k, v in instr.items() if k not in _FIELDS} or None
+        op = instr.get("op")
+        if op is None:
+            return cls(Opcode.LABEL, labels=(sys.intern(instr["label"]),), extras=extras, source=source)
+        dest = instr.get("dest")
+        args = instr.get("args")
+        funcs = instr.get("funcs")
+        labels = instr.get("labels")
+        return cls(
+            OPCODE_OF.get(op, Opcode.OTHER),
+            dest=variables.id(dest) if dest is not None else NO_DEST,
+            type=instr.get("type"),
+            args=tuple(variables.id(a) for a in args) if args is not None else None,
+            funcs=tuple(sys.intern(f) for f in funcs) if funcs is not None else None,
+            labels=tuple(sys.intern(l) for l in labels) if labels is not None else None,
+            value=instr.get("value"),
+            opname=sys.intern(op),
+            extras=extras,
+            source=source,
+        )
+
+    def to_json(self, variables: VarTable) -> dict:
+        if self.source is not None:
+            return self.source
+        if self.op == Opcode.LABEL:
+            instr = {"label": self.labels[0]}
+            return dict(sorted((instr | self.extras).items())) if self.extras else instr
+        names = variables.names
+        instr = {}
+        if self.args is not None:
+            instr["args"] = [names[a] for a in self.args]
+        if self.dest != NO_DEST:
+            instr["dest"] = names[self.dest]
+        if self.funcs is not None:
+            instr["funcs"] = list(self.funcs)
+        if self.labels is not None:
+            instr["labels"] = list(self.labels)
+        instr["op"] = self.opname
+        if self.type is not None:
+            instr["type"] = self.type
+        if self.value is not None:
+            instr["value"] = self.value
+        if self.extras:
+            # Keys stay in sorted order, like in `bril2json`'s output
+            instr = dict(sorted((instr | self.extras).items()))
+        return instr
+
+    def __repr__(self) -> str:
+        if self.op == Opcode.LABEL:
+            return f"Instr(.{self.labels[0]})"
+        return f"Instr({self.opname}, dest={self.dest}, args={self.args})"
+
+
+class Function:
+    """A Bril function whose instructions are `Instr`s over the variables of `vars`.
+    `args` are the ids of the function's arguments and `arg_types` their types"""
+
+    __slots__ = ("name", "args", "arg_types", "type", "instrs", "vars", "extras")
+
+    def __init__(self, name: str, instrs: list[Instr], variables: VarTable, args: tuple[int, ...] | None = None,
+                 arg_types: tuple | None = None, type=None, extras: dict | None = None):
+        self.name = name
+        self.instrs = instrs
+        self.vars = variables
+        self.args = args
+        self.arg_types = arg_types
+        self.type = type
+        self.extras = extras
+
+    @classmethod
+    def from_json(cls, func: dict, keep_source: bool = False) -> "Function":
+        variables = VarTable()
+        args = func.get("args")
+        arg_ids = tuple(variables.id(arg["name"]) for arg in args) if args is not None else None
+        arg_types = tuple(arg["type"] for arg in args) if args is not None else None
+        instrs = [Instr.from_json(instr, variables, keep_source) for instr in func.get("instrs", ())]
+        extras = {k: v for k, v in func.items() if k not in ("name", "args", "type", "instrs")} or None
+        return cls(func["name"], instrs, variables, arg_ids, arg_types, func.get("type"), extras)
+
+    def to_json(self) -> dict:
+        func = {}
+        if self.args is not None:
+            func["args"] = [{"name": self.vars.names[a], "type": t} for a, t in zip(self.args, self.arg_types)]
+        func["instrs"] = [instr.to_json(self.vars) for instr in self.instrs]
+        func["name"] = self.name
+        if self.type is not None:
+            func["type"] = self.type
+        if self.extras:
+            func.update(self.extras)
+        return func
+
+    def blocks(self) -> list[list[Instr]]:
+        """Basic blocks, split the same way as `form_basic_blocks`"""
+        blocks = []
+        block = []
+        for instr in self.instrs:
+            if instr.op == Opcode.LABEL:
+                if block:
+                    blocks.append(block)
+                block = [instr]
+            else:
+                block.append(instr)
+                if instr.flags & IS_TERMINATOR:
+                    blocks.append(block)
+                    block = []
+        if block:
+            blocks.append(block)
+        return blocks
+
+
+class TestBrilIR(unittest.TestCase):
+    func = {
+        "args": [{"name": "n", "type": "int"}],
+        "instrs": [
+            {"dest": "one", "op": "const", "type": "int", "value": 1},
+            {"label": "loop"},
+            {"args": ["n", "one"], "dest": "n", "op": "sub", "type": "int"},
+            {"args": ["n"], "labels": ["loop", "done"], "op": "br"},
+            {"label": "done"},
+            {"args": ["n"], "dest": "r", "funcs": ["f"], "op": "call", "type": "int"},
+            {"args": ["r"], "op": "print"},
+            {"op": "ret"},
+            {"op": "frobnicate", "args": ["r"]},
+        ],
+        "name": "main",
+    }
+
+    def test_round_trip(self):
+        for keep_source in (False, True):
+            self.assertEqual(Function.from_json(self.func, keep_source).to_json(), self.func)
+
+    def test_source_dicts_are_reused(self):
+        func = Function.from_json(self.func, keep_source=True)
+        func.instrs[0] = func.instrs[0].replace(value=2)
+        out = func.to_json()
+        self.assertIs(out["instrs"][2], self.func["instrs"][2])
+        self.assertEqual(out["instrs"][0], {"dest": "one", "op": "const", "type": "int", "value": 2})
+
+    def test_extra_keys_survive_rewrites(self):
+        pos = {"row": 3, "col": 2}
+        func = {"instrs": [{"label": "start", "pos": pos},
+                           {"args": ["x"], "dest": "y", "op": "id", "pos": pos, "type": "int"}], "name": "main"}
+        for keep_source in (False, True):
+            f = Function.from_json(func, keep_source)
+            self.assertEqual(f.to_json(), func)
+            f.instrs[1] = f.instrs[1].replace(args=(f.instrs[1].dest,))
+            out = f.to_json()
+            self.assertEqual(out["instrs"][1], {"args": ["y"], "dest": "y", "op": "id", "pos": pos, "type": "int"})
+            self.assertEqual(list(out["instrs"][1]), ["args", "dest", "op", "pos", "type"])
+
+    def test_interned_variables_and_flags(self):
+        func = Function.from_json(self.func)
+        one, loop, sub, br, _, call, _, ret, other = func.instrs
+        self.assertEqual(sub.dest, sub.args[0])
+        self.assertEqual(func.vars.names[sub.args[1]], "one")
+        self.assertTrue(one.is_pure and one.has_dest and not one.is_terminator)
+        self.assertTrue(br.is_terminator and not br.has_dest)
+        self.assertFalse(call.is_pure)
+        self.assertTrue(ret.is_terminator)
+        self.assertEqual((other.op, other.opname), (Opcode.OTHER, "frobnicate"))
+        self.assertTrue(loop.is_label)
+
+    def test_blocks(self):
+        func = Function.from_json(self.func)
+        self.assertEqual([len(b) for b in func.blocks()], [1, 3, 4, 1])
+
+    def test_fresh_variables(self):
+        func = Function.from_json(self.func)
+        v = func.vars.fresh("v")
+        self.assertNotIn(func.vars.names[v], {"n", "one", "r"})
+        self.assertNotEqual(func.vars.fresh("v"), v)
+
+
+if __name__ == "__main__":
+    unittest.main()
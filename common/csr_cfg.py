@@ -0,0 +1,262 @@
+import unittest
+from array import array
+from collections.abc import Mapping
+
+# Compact, array-backed control flow graph shared by the L4-L6 analyses.
+#
+# Successors and predecessors are stored in CSR (compressed sparse row) layout:
+# the successors of node `v` are `succ_targets[succ_offsets[v]:succ_offsets[v+1]]`,
+# and likewise for predecessors. Nodes are numbered 0..n-1, as produced by `build_cfg`
+# (which adds a dummy exit node `n-1` after the last basic block).
+
+
+def _csr(n: int, edges: list[tuple[int, int]]) -> tuple[array, array]:
+    """Builds (offsets, targets) arrays from a list of (source, target) edges,
+    keeping the relative order of the edges out of each source node"""
+    offsets = array("i", bytes(4 * (n + 1)))
+    for src, _ in edges:
+        offsets[src + 1] += 1
+    for v in range(n):
+        offsets[v + 1] += offsets[v]
+    targets = array("i", bytes(4 * len(edges)))
+    fill = offsets[:-1]
+    for src, dst in edges:
+        targets[fill[src]] = dst
+        fill[src] += 1
+    return offsets, targets
+
+
+class CSRCFG(Mapping):
+    """A CFG over nodes 0..n-1 with successors and predecessors stored as flat
+    `array('i')` offset/target buffers.
+
+    Also implements the read-only `dict[int, list[int]]` interface of the
+    CFGs returned by `build_cfg`, so it can be passed to existing code."""
+
+    __slots__ = ("n", "succ_offsets", "succ_targets", "pred_offsets", "pred_targets")
+
+    def __init__(self, n: int, edges: list[tuple[int, int]]):
+        self.n = n
+        self.succ_offsets, self.succ_targets = _csr(n, edges)
+        self.pred_offsets, self.pred_targets = _csr(n, [(dst, src) for src, dst in edges])
+
+    @classmethod
+    def from_dict(cls, cfg: dict[int, list[int]]) -> "CSRCFG":
+        """Converts a dict-of-lists CFG whose keys are exactly 0..n-1"""
+        if isinstance(cfg, CSRCFG):
+            return cfg
+        n = len(cfg)
+        if any(v not in cfg for v in range(n)):
+            raise ValueError("CFG nodes must be numbered 0..n-1")
+        return cls(n, [(v, s) for v in range(n) for s in cfg[v]])
+
+    def reversed(self) -> "CSRCFG":
+        """Returns the reverse CFG (sharing this CFG's buffers)"""
+        rev = CSRCFG.__new__(CSRCFG)
+        rev.n = self.n
+        rev.succ_offsets, rev.succ_targets = self.pred_offsets, self.pred_targets
+        rev.pred_offsets, rev.pred_targets = self.succ_offsets, self.succ_targets
+        return rev
+
+    # ------------------------------ Traversal ------------------------------- #
+
+    def successors(self, v: int):
+        """Iterates over the successors of `v` without allocating a list"""
+        targets = self.succ_targets
+        for i in range(self.succ_offsets[v], self.succ_offsets[v + 1]):
+            yield targets[i]
+
+    def predecessors(self, v: int):
+        """Iterates over the predecessors of `v` without allocating a list"""
+        targets = self.pred_targets
+        for i in range(self.pred_offsets[v], self.pred_offsets[v + 1]):
+            yield targets[i]
+
+    def succ_view(self, v: int) -> memoryview:
+        """Zero-copy view of the successors of `v`"""
+        return memoryview(self.succ_targets)[self.succ_offsets[v]:self.succ_offsets[v + 1]]
+
+    def pred_view(self, v: int) -> memoryview:
+        """Zero-copy view of the predecessors of `v`"""
+        return memoryview(self.pred_targets)[self.pred_offsets[v]:self.pred_offsets[v + 1]]
+
+    def num_edges(self) -> int:
+        return len(self.succ_targets)
+
+    def postorder(self, entry: int = 0) -> list[int]:
+        """Iterative DFS postorder of the nodes reachable from `entry`"""
+        offsets, targets = self.succ_offsets, self.succ_targets
+        visited = bytearray(self.n)
+        visited[entry] = 1
+        order = []
+        # Stack of (node, index of the next successor edge to explore)
+        stack = [(entry, offsets[entry])]
+        while stack:
+            v, i = stack[-1]
+            if i < offsets[v + 1]:
+                stack[-1] = (v, i + 1)
+                s = targets[i]
+                if not visited[s]:
+                    visited[s] = 1
+                    stack.append((s, offsets[s]))
+            else:
+                stack.pop()
+                order.append(v)
+        return order
+
+    def as_numpy(self):
+        """Zero-copy NumPy views of the buffers, as
+        `(succ_offsets, succ_targets, pred_offsets, pred_targets)`"""
+        import numpy as np
+
+        return tuple(
+            np.frombuffer(buf, dtype=np.intc)
+            for buf in (self.succ_offsets, self.succ_targets, self.pred_offsets, self.pred_targets)
+        )
+
+    def sccs(self) -> list[list[int]]:
+        """Strongly connected components (Tarjan's algorithm, iteratively), in topological
+        order: every edge between two components goes from an earlier one to a later one"""
+        offsets, targets = self.succ_offsets, self.succ_targets
+        index = [-1] * self.n
+        low = [0] * self.n
+        on_stack = bytearray(self.n)
+        stack = []
+        components = []
+        counter = 0
+        for root in range(self.n):
+            if index[root] != -1:
+                continue
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+            # DFS stack of (node, index of the next successor edge to explore)
+            dfs = [(root, offsets[root])]
+            while dfs:
+                v, i = dfs[-1]
+                if i < offsets[v + 1]:
+                    dfs[-1] = (v, i + 1)
+                    s = targets[i]
+                    if index[s] == -1:
+                        index[s] = low[s] = counter
+                        counter += 1
+                        stack.append(s)
+                        on_stack[s] = 1
+                        dfs.append((s, offsets[s]))
+                    elif on_stack[s] and index[s] < low[v]:
+                        low[v] = index[s]
+                    continue
+                dfs.pop()
+                if dfs and low[v] < low[dfs[-1][0]]:
+                    low[dfs[-1][0]] = low[v]
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = 0
+                        component.append(w)
+                        if w == v:
+                            break
+                    components.append(component)
+        # Tarjan's algorithm finds the components in reverse topological order
+        components.reverse()
+        return components
+
+    # ---------------------- dict[int, list[int]] shim ----------------------- #
+
+    def __getitem__(self, v: int) -> list[int]:
+        if not isinstance(v, int) or not 0 <= v < self.n:
+            raise KeyError(v)
+        return self.succ_targets[self.succ_offsets[v]:self.succ_offsets[v + 1]].tolist()
+
+    def __iter__(self):
+        return iter(range(self.n))
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __contains__(self, v) -> bool:
+        return isinstance(v, int) and 0 <= v < self.n
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+    def to_dict(self) -> dict[int, list[int]]:
+        return {v: self[v] for v in range(self.n)}
+
+    def pred_dict(self) -> dict[int, list[int]]:
+        """Same result as `get_pred_cfg(cfg)`"""
+        return {v: self.pred_targets[self.pred_offsets[v]:self.pred_offsets[v + 1]].tolist() for v in range(self.n)}
+
+
+def build_csr_cfg(basic_blocks: list[list[dict]]) -> CSRCFG:
+    """Same CFG as `build_cfg(basic_blocks)` (including the dummy exit node),
+    built directly into CSR form"""
+    label_to_block = dict()
+    for i, basic_block in enumerate(basic_blocks):
+        if "label" in basic_block[0]:
+            label_to_block[basic_block[0]["label"]] = i
+
+    exit_node = len(basic_blocks)
+    edges = []
+    for i, basic_block in enumerate(basic_blocks):
+        last = basic_block[-1]
+        op = last.get("op")
+        if op in ("jmp", "br"):
+            edges.extend((i, label_to_block[l]) for l in last["labels"])
+        elif op == "ret":
+            edges.append((i, exit_node))
+        else:
+            edges.append((i, i + 1))
+    return CSRCFG(exit_node + 1, edges)
+
+
+class TestCSRCFG(unittest.TestCase):
+    # 0 -> 1 -> {2, 3}, 2 -> 1, 3 -> 4 (exit), with a duplicated edge 1 -> 3
+    cfg = {0: [1], 1: [2, 3, 3], 2: [1], 3: [4], 4: []}
+
+    def test_dict_shim(self):
+        g = CSRCFG.from_dict(self.cfg)
+        self.assertEqual(g.to_dict(), self.cfg)
+        self.assertEqual(dict(g.items()), self.cfg)
+        self.assertEqual(g, self.cfg)
+        self.assertEqual(g.get(9, []), [])
+        self.assertEqual(list(g.keys()), [0, 1, 2, 3, 4])
+
+    def test_predecessors(self):
+        g = CSRCFG.from_dict(self.cfg)
+        self.assertEqual(g.pred_dict(), {0: [], 1: [0, 2], 2: [1], 3: [1, 1], 4: [3]})
+        self.assertEqual(list(g.predecessors(1)), [0, 2])
+        self.assertEqual(g.pred_view(3).tolist(), [1, 1])
+        self.assertEqual(g.reversed().to_dict(), g.pred_dict())
+
+    def test_build_from_blocks(self):
+        blocks = [
+            [{"dest": "x", "op": "const", "type": "int", "value": 1}],
+            [{"label": "loop"}, {"args": ["c"], "labels": ["body", "done"], "op": "br"}],
+            [{"label": "body"}, {"labels": ["loop"], "op": "jmp"}],
+            [{"label": "done"}, {"op": "ret"}],
+        ]
+        self.assertEqual(build_csr_cfg(blocks).to_dict(), {0: [1], 1: [2, 3], 2: [1], 3: [4], 4: []})
+
+    def test_postorder(self):
+        g = CSRCFG.from_dict(self.cfg)
+        self.assertEqual(g.postorder(0), [2, 4, 3, 1, 0])
+        self.assertEqual(g.reversed().postorder(4), [0, 2, 1, 3, 4])
+
+    def test_sccs(self):
+        g = CSRCFG.from_dict(self.cfg)
+        self.assertEqual([sorted(c) for c in g.sccs()], [[0], [1, 2], [3], [4]])
+        self.assertEqual([sorted(c) for c in g.reversed().sccs()], [[4], [3], [1, 2], [0]])
+        # Two loops one after the other, and an unreachable node 5
+        g = CSRCFG.from_dict({0: [1], 1: [2], 2: [1, 3], 3: [4, 3], 4: [], 5: [0]})
+        self.assertEqual([sorted(c) for c in g.sccs()], [[5], [0], [1, 2], [3], [4]])
+
+    def test_rejects_sparse_nodes(self):
+        with self.assertRaises(ValueError):
+            CSRCFG.from_dict({0: [2], 2: []})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+# Runs a per-function pass over all the functions of a program in a pool of worker processes.
+#
+# Functions are independent in every pass, so they can be processed in any order; results
+# are returned in the order of the functions, so the output doesn't depend on the number of jobs.
+# Starting the workers and sending functions to them has a cost, so small programs are
+# processed serially in this process instead.
+
+# Programs with fewer functions than this are always processed serially
+MIN_PARALLEL_FUNCTIONS = 16
+
+
+def add_jobs_argument(parser) -> None:
+    """Adds the `--jobs N` option to an `argparse` parser"""
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of worker processes to spread the functions over (0: one per CPU)")
+
+
+def map_functions(fn, functions: list, jobs: int = 1, chunksize: int | None = None) -> list:
+    """`[fn(f) for f in functions]`, computed by `jobs` worker processes (`0` for one per CPU).
+    `fn` must be picklable, i.e. a module-level function (or a `functools.partial` of one).
+    Functions are sent to the workers in chunks of `chunksize` (by default, about four chunks per worker)"""
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1 or len(functions) < MIN_PARALLEL_FUNCTIONS:
+        return [fn(f) for f in functions]
+    if chunksize is None:
+        chunksize = max(1, len(functions) // (4 * jobs))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        # `map` yields the results in the order of its inputs
+        return list(pool.map(fn, functions, chunksize=chunksize))
+
+
+def imap_functions(fn, functions, jobs: int = 1, window: int | None = None):
+    """Lazy version of `map_functions` for a stream of functions: yields `fn(f)` for each function in order,
+    reading at most `window` functions ahead (by default 16 per worker), so memory use stays bounded"""
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    functions = iter(functions)
+    if jobs <= 1:
+        for f in functions:
+            yield fn(f)
+        return
+    window = max(window or 16 * jobs, MIN_PARALLEL_FUNCTIONS)
+    batch = list(islice(functions, window))
+    if len(batch) < MIN_PARALLEL_FUNCTIONS:
+        # That's the whole program
+        for f in batch:
+            yield fn(f)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        while batch:
+            yield from pool.map(fn, batch, chunksize=max(1, len(batch) // (4 * jobs)))
+            batch = list(islice(functions, window))
+
+
+def _count_instrs(func: dict) -> tuple[str, int]:
+    return func["name"], len(func["instrs"])
+
+
+class TestParallel(unittest.TestCase):
+    functions = [{"name": f"f{i}", "instrs": [{"op": "nop"}] * (i % 7)} for i in range(3 * MIN_PARALLEL_FUNCTIONS)]
+
+    def test_results_are_in_order(self):
+        expected = [_count_instrs(f) for f in self.functions]
+        self.assertEqual(map_functions(_count_instrs, self.functions, jobs=3), expected)
+        self.assertEqual(map_functions(_count_instrs, self.functions, jobs=2, chunksize=5), expected)
+
+    def test_lazy_results_are_in_order(self):
+        expected = [_count_instrs(f) for f in self.functions]
+        for jobs in (1, 2):
+            results = imap_functions(_count_instrs, iter(self.functions), jobs=jobs, window=MIN_PARALLEL_FUNCTIONS)
+            self.assertEqual(list(results), expected)
+
+    def test_small_programs_are_serial(self):
+        # Lambdas can't be sent to worker processes, so this only works serially
+        functions = self.functions[:MIN_PARALLEL_FUNCTIONS - 1]
+        self.assertEqual(map_functions(lambda f: f["name"], functions, jobs=4), [f["name"] for f in functions])
+
+
+if __name__ == "__main__":
+    unittest.main()
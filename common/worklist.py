@@ -0,0 +1,162 @@
+import heapq
+import unittest
+
+from csr_cfg import CSRCFG
+
+# Worklists for the L4 dataflow solvers.
+#
+# Processing blocks in (reverse) postorder means that, outside of loops, a block is
+# only visited once all of the blocks its facts come from have been visited, so
+# converging takes far fewer transfer function calls than popping blocks in
+# arbitrary (hash) order from a set.
+
+# Visit orders accepted by `make_worklist`
+# - "rpo": reverse postorder of the CFG for forward analyses, postorder for backward ones
+# - "index": ascending block index
+# - "set": no particular order (`set.pop()`), the original behaviour
+# - "scc": strongly connected components in topological order (in the direction of the analysis),
+#   and "rpo" within each component. A component only starts once every component that
+#   flows into it has converged, so acyclic regions are solved in a single pass
+ORDERS = ("rpo", "index", "set", "scc")
+
+
+class PriorityWorklist:
+    """Worklist over nodes 0..n-1 that always pops the pending node with the smallest rank.
+    A node is queued at most once at a time; `update` and `pop` mirror the `set` methods
+    the solvers used before, so either can be used as the worklist"""
+
+    __slots__ = ("rank", "node_at", "queued", "heap")
+
+    def __init__(self, rank: list[int], nodes=()):
+        self.rank = rank
+        # Ranks are a permutation of 0..n-1, so map them back to nodes
+        self.node_at = [0] * len(rank)
+        for v, r in enumerate(rank):
+            self.node_at[r] = v
+        self.queued = bytearray(len(rank))
+        self.heap: list[int] = []
+        self.update(nodes)
+
+    def add(self, v: int) -> None:
+        if not self.queued[v]:
+            self.queued[v] = 1
+            heapq.heappush(self.heap, self.rank[v])
+
+    def update(self, nodes) -> None:
+        for v in nodes:
+            self.add(v)
+
+    def pop(self) -> int:
+        v = self.node_at[heapq.heappop(self.heap)]
+        self.queued[v] = 0
+        return v
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def __bool__(self) -> bool:
+        return bool(self.heap)
+
+
+class SCCWorklist(PriorityWorklist):
+    """`PriorityWorklist` that ranks nodes by strongly connected component, and counts
+    how many times nodes of each component are popped (`visits[c]` for `components[c]`)"""
+
+    __slots__ = ("components", "component_of", "visits")
+
+    def __init__(self, components: list[list[int]], base_rank: list[int], nodes=()):
+        self.components = [sorted(c, key=base_rank.__getitem__) for c in components]
+        self.component_of = [0] * len(base_rank)
+        rank = [0] * len(base_rank)
+        r = 0
+        for c, component in enumerate(self.components):
+            for v in component:
+                self.component_of[v] = c
+                rank[v] = r
+                r += 1
+        self.visits = [0] * len(self.components)
+        super().__init__(rank, nodes)
+
+    def pop(self) -> int:
+        v = super().pop()
+        self.visits[self.component_of[v]] += 1
+        return v
+
+
+def node_ranks(graph: CSRCFG, entry: int = 0, forward: bool = True) -> list[int]:
+    """Rank of every node in the "rpo" visit order (nodes unreachable from `entry` go last, by index)"""
+    order = graph.postorder(entry)
+    if forward:
+        order.reverse()
+    rank = [-1] * graph.n
+    for r, v in enumerate(order):
+        rank[v] = r
+    next_rank = len(order)
+    for v in range(graph.n):
+        if rank[v] == -1:
+            rank[v] = next_rank
+            next_rank += 1
+    return rank
+
+
+def make_worklist(graph: CSRCFG, entry: int = 0, forward: bool = True, order: str = "rpo"):
+    """Worklist initially containing every node of `graph`, popped in the given visit order"""
+    if order == "set":
+        return set(range(graph.n))
+    if order == "scc":
+        # Components of the graph the facts flow along
+        components = (graph if forward else graph.reversed()).sccs()
+        return SCCWorklist(components, node_ranks(graph, entry, forward), range(graph.n))
+    if order == "index":
+        rank = list(range(graph.n))
+    elif order == "rpo":
+        rank = node_ranks(graph, entry, forward)
+    else:
+        raise ValueError(f"unknown visit order '{order}' (choose from {', '.join(ORDERS)})")
+    return PriorityWorklist(rank, range(graph.n))
+
+
+class TestWorklist(unittest.TestCase):
+    # 0 -> 1 -> {2, 3}, 2 -> 1, 3 -> 4 (exit), 5 is unreachable
+    cfg = {0: [1], 1: [3, 2], 2: [1], 3: [4], 4: [], 5: [4]}
+
+    def drain(self, worklist):
+        order = []
+        while worklist:
+            order.append(worklist.pop())
+        return order
+
+    def test_rpo_forward(self):
+        worklist = make_worklist(CSRCFG.from_dict(self.cfg), forward=True)
+        self.assertEqual(self.drain(worklist), [0, 1, 2, 3, 4, 5])
+
+    def test_po_backward(self):
+        worklist = make_worklist(CSRCFG.from_dict(self.cfg), forward=False)
+        self.assertEqual(self.drain(worklist), [4, 3, 2, 1, 0, 5])
+
+    def test_scc_order(self):
+        # Nothing flows into 5 (unreachable) so its component comes first,
+        # and the loop 1 <-> 2 is solved before its exit 3
+        worklist = make_worklist(CSRCFG.from_dict(self.cfg), order="scc")
+        self.assertEqual(worklist.pop(), 5)
+        self.assertEqual(worklist.pop(), 0)
+        self.assertEqual(worklist.pop(), 1)
+        worklist.add(1)
+        self.assertEqual(self.drain(worklist), [1, 2, 3, 4])
+        self.assertEqual([sorted(c) for c in worklist.components], [[5], [0], [1, 2], [3], [4]])
+        self.assertEqual(worklist.visits, [1, 1, 3, 1, 1])
+
+    def test_nodes_are_queued_once(self):
+        worklist = make_worklist(CSRCFG.from_dict(self.cfg), order="index")
+        self.assertEqual(worklist.pop(), 0)
+        worklist.update([0, 3, 3, 0])
+        self.assertEqual(len(worklist), 6)
+        self.assertEqual(self.drain(worklist), [0, 1, 2, 3, 4, 5])
+
+    def test_unknown_order(self):
+        with self.assertRaises(ValueError):
+            make_worklist(CSRCFG.from_dict(self.cfg), order="random")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+import operator
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+
+from bril_ir import Opcode
+
+# Constant folding and algebraic simplification of single Bril instructions, used by LVN.
+#
+# `fold` computes the result of an operation whose arguments are all constants, following the
+# semantics of the reference interpreter (64-bit wrapping integers, division truncating towards zero).
+# Operations that would fail at runtime (division by zero) or produce a value that can't be written as
+# a Bril constant (infinities, NaN) are not folded, so the program still behaves the same when it runs.
+#
+# `simplify` uses identities that hold whatever the value of the non-constant arguments is
+# (`x + 0 = x`, `x * 0 = 0`, `x - x = 0`, `x and true = x`...).
+
+_INT_BITS = 64
+
+
+def _wrap(n: int) -> int:
+    """Wraps an integer to a signed 64-bit value"""
+    n &= (1 << _INT_BITS) - 1
+    return n - (1 << _INT_BITS) if n >> (_INT_BITS - 1) else n
+
+
+def _div(a: int, b: int) -> int | None:
+    if b == 0:
+        return None
+    # Python's `//` rounds towards negative infinity, Bril's division towards zero
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+_INT_OPS = {
+    Opcode.ADD: operator.add,
+    Opcode.SUB: operator.sub,
+    Opcode.MUL: operator.mul,
+    Opcode.DIV: _div,
+}
+
+_COMPARISONS = {
+    Opcode.EQ: operator.eq, Opcode.LT: operator.lt, Opcode.GT: operator.gt,
+    Opcode.LE: operator.le, Opcode.GE: operator.ge,
+    Opcode.FEQ: operator.eq, Opcode.FLT: operator.lt, Opcode.FGT: operator.gt,
+    Opcode.FLE: operator.le, Opcode.FGE: operator.ge,
+}
+
+_FLOAT_OPS = {
+    Opcode.FADD: operator.add,
+    Opcode.FSUB: operator.sub,
+    Opcode.FMUL: operator.mul,
+    Opcode.FDIV: operator.truediv,
+}
+
+# Comparisons of a variable with itself (floats are left alone, NaN isn't equal to itself)
+_SELF_COMPARISONS = {Opcode.EQ: True, Opcode.LE: True, Opcode.GE: True, Opcode.LT: False, Opcode.GT: False}
+
+
+def fold(op: int, consts: list):
+    """The constant computed by operation `op` on constant arguments `consts`,
+    or None if it can't (or mustn't) be computed at compile time"""
+    try:
+        if op in _INT_OPS:
+            a, b = (int(c) for c in consts)
+            result = _INT_OPS[op](a, b)
+            return _wrap(result) if result is not None else None
+        if op in _COMPARISONS:
+            a, b = consts
+            return _COMPARISONS[op](a, b)
+        if op in _FLOAT_OPS:
+            result = _FLOAT_OPS[op](*(float(c) for c in consts))
+            # Infinities and NaN have no JSON representation
+            return result if result - result == 0 else None
+        if op == Opcode.NOT:
+            (a,) = consts
+            return not a
+        if op == Opcode.AND:
+            a, b = consts
+            return bool(a and b)
+        if op == Opcode.OR:
+            a, b = consts
+            return bool(a or b)
+    except (ValueError, TypeError, ZeroDivisionError, OverflowError):
+        # Malformed constants, or a float division by zero
+        return None
+    return None
+
+
+# Results of `simplify`
+CONST, COPY = "const", "id"
+
+
+def simplify(op: int, args: list, consts: list) -> tuple | None:
+    """Simplifies operation `op` on `args` (any hashable values identifying the arguments, equal
+    when the arguments are known to hold the same value), where `consts` holds the constant value of
+    each argument or None. Returns `(CONST, value)`, `(COPY, i)` when the result is the `i`-th argument,
+    or None when no identity applies"""
+    if len(args) != 2:
+        return None
+    a, b = consts
+    if op == Opcode.ADD:
+        if b == 0:
+            return (COPY, 0)
+        if a == 0:
+            return (COPY, 1)
+    elif op == Opcode.SUB:
+        if b == 0:
+            return (COPY, 0)
+        if args[0] == args[1]:
+            return (CONST, 0)
+    elif op == Opcode.MUL:
+        if b == 1:
+            return (COPY, 0)
+        if a == 1:
+            return (COPY, 1)
+        if a == 0 or b == 0:
+            return (CONST, 0)
+    elif op == Opcode.DIV:
+        if b == 1:
+            return (COPY, 0)
+    elif op == Opcode.AND or op == Opcode.OR:
+        # `x and true = x`, `x and false = false`, `x or false = x`, `x or true = true`
+        neutral = op == Opcode.AND
+        if b is not None:
+            return (COPY, 0) if b == neutral else (CONST, not neutral)
+        if a is not None:
+            return (COPY, 1) if a == neutral else (CONST, not neutral)
+        if args[0] == args[1]:
+            return (COPY, 0)
+    elif op in _SELF_COMPARISONS and args[0] == args[1]:
+        return (CONST, _SELF_COMPARISONS[op])
+    return None
+
+
+class TestFold(unittest.TestCase):
+    def test_integer_arithmetic(self):
+        self.assertEqual(fold(Opcode.ADD, [2, 3]), 5)
+        self.assertEqual(fold(Opcode.SUB, [2, 3]), -1)
+        self.assertEqual(fold(Opcode.MUL, [2**62, 4]), 0)
+        self.assertEqual(fold(Opcode.ADD, [2**63 - 1, 1]), -(2**63))
+        self.assertEqual(fold(Opcode.DIV, [-7, 2]), -3)
+        self.assertEqual(fold(Opcode.DIV, [-(2**63), -1]), -(2**63))
+
+    def test_division_by_zero_is_not_folded(self):
+        self.assertIsNone(fold(Opcode.DIV, [1, 0]))
+        self.assertIsNone(fold(Opcode.FDIV, [1.0, 0.0]))
+        self.assertIsNone(fold(Opcode.FDIV, [0.0, 0]))
+
+    def test_bool_and_float(self):
+        self.assertIs(fold(Opcode.LT, [1, 2]), True)
+        self.assertIs(fold(Opcode.AND, [True, False]), False)
+        self.assertIs(fold(Opcode.NOT, [False]), True)
+        self.assertEqual(fold(Opcode.FMUL, [1.5, 2]), 3.0)
+        self.assertIs(fold(Opcode.FGE, [1.5, 2.0]), False)
+        self.assertIsNone(fold(Opcode.CALL, [1, 2]))
+
+    def test_identities(self):
+        self.assertEqual(simplify(Opcode.ADD, ["x", "y"], [None, 0]), (COPY, 0))
+        self.assertEqual(simplify(Opcode.MUL, ["x", "y"], [1, None]), (COPY, 1))
+        self.assertEqual(simplify(Opcode.MUL, ["x", "y"], [None, 0]), (CONST, 0))
+        self.assertEqual(simplify(Opcode.SUB, ["x", "x"], [None, None]), (CONST, 0))
+        self.assertEqual(simplify(Opcode.AND, ["x", "y"], [None, True]), (COPY, 0))
+        self.assertEqual(simplify(Opcode.OR, ["x", "y"], [True, None]), (CONST, True))
+        self.assertEqual(simplify(Opcode.LT, ["x", "x"], [None, None]), (CONST, False))
+        self.assertIsNone(simplify(Opcode.ADD, ["x", "y"], [None, None]))
+        self.assertIsNone(simplify(Opcode.FLT, ["x", "x"], [None, None]))
+        self.assertIsNone(simplify(Opcode.DIV, ["x", "y"], [None, 0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
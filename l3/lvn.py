@@ -1,142 +1,217 @@
 import argparse
-import json
+import functools
+import math
+import os
 import sys
 from dataclasses import dataclass
 
-from util import form_basic_blocks
-from tdce import tdce
+from cfg import form_basic_blocks
+from fold import CONST, fold, simplify
+from tdce import dead_instructions
 
-@dataclass
-class LVNRow:
-    value: tuple
-    var: str
+# Parallel per-function execution and program I/O are shared with L4-L6
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+
+from bril_io import add_format_arguments, stream_program
+from bril_ir import HAS_DEST, IS_PURE, Instr, Opcode, VarTable
+from parallel import add_jobs_argument
 
 @dataclass
 class LVN:
-    table: list[LVNRow]
-    var_to_row: dict[str, int] # Maps from a variable to a table index
+    """Value table of a block. Row `r` holds a value and the variable it is stored in:
+    `values[r]` is an (opcode, operands...) tuple, `()` for a value that comes from an earlier block,
+    or (opcode, index) for the result of an instruction that isn't numbered (it's never looked up)"""
+    values: list[tuple]
+    vars: list[int] # Variable id holding each row's value
+    var_to_row: dict[int, int] # Maps from a variable to a table index
     val_to_row: dict[tuple, int] # Maps from a value to a table index
 
+    def add(self, value: tuple, var: int) -> int:
+        self.values.append(value)
+        self.vars.append(var)
+        return len(self.values) - 1
+
+
+class FreshNames:
+    """Generates the `{var}_{n}` names given to variables that are overwritten later in a block,
+    skipping the reserved names (every variable the function defines, and the names given out so far).
+    The next `n` to try is kept for each variable, so names are found without rescanning"""
+
+    def __init__(self, reserved_vars: set[str]):
+        self.reserved = reserved_vars
+        self.next: dict[str, int] = {}
+
+    def __call__(self, var: str) -> str:
+        attempt = self.next.get(var, 1)
+        while f"{var}_{attempt}" in self.reserved:
+            attempt += 1
+        new_var = f"{var}_{attempt}"
+        self.reserved.add(new_var)
+        self.next[var] = attempt + 1
+        return new_var
+
+
+COMMUTATIVE = frozenset((Opcode.ADD, Opcode.MUL, Opcode.EQ, Opcode.AND, Opcode.OR))
 
-def _ignore_instruction_lvn(instr: dict) -> bool:
+
+def _ignore_instruction_lvn(instr: Instr) -> bool:
     """Returns a bool representing whether an instruction needs to be considered by LVN"""
-    if "op" not in instr:
-        # Label
+    op = instr.op
+    if op == Opcode.LABEL:
         return True
-    elif instr["op"] in ["jmp", "nop"]:
+    elif op == Opcode.JMP or op == Opcode.NOP:
         # Operations that never have dest or args
         return True
-    elif instr["op"] in ["ret", "print"] and "args" not in instr:
+    elif (op == Opcode.RET or op == Opcode.PRINT) and instr.args is None:
         # Operations that may not have args
         return True
     else:
         return False
 
+def const_value(instr: Instr) -> tuple:
+    """The table value of a `const` instruction. `0.0 == -0.0` in Python, but they are different
+    float constants (e.g. `1 / -0.0` is negative), so the sign of floats is part of the value"""
+    if instr.type == "float" and isinstance(instr.value, (int, float)):
+        return (instr.opname, instr.type, instr.value, math.copysign(1.0, instr.value))
+    return (instr.opname, instr.type, instr.value)
+
+
 def canonicalize(value):
     """Canonicalizes the value tuple to support commutativity"""
     op, *nums = value
     return (op, *sorted(nums))
-    
-def lvn(block: list[dict], reserved_vars: set[str]) -> list[dict]:
-    """Accepts a basic block and a set of reserved variable names and returns a copy rewritten using LVN"""
-    state = LVN([], {}, {})
+
+
+def _fold(state: LVN, instr: Instr) -> Instr:
+    """Rewrites an instruction whose arguments are in the table to a `const` if its result is known,
+    or to an `id` of one of its arguments if an algebraic identity applies (e.g. `x + 0`)"""
+    rows = [state.var_to_row[v] for v in instr.args]
+    consts = []
+    for row in rows:
+        value = state.values[row]
+        consts.append(value[2] if value and value[0] == "const" else None)
+    result = None
+    if None not in consts:
+        constant = fold(instr.op, consts)
+        if constant is not None:
+            result = (CONST, constant)
+    if result is None:
+        result = simplify(instr.op, rows, consts)
+    if result is None:
+        return instr
+    kind, x = result
+    if kind == CONST:
+        return instr.replace(op=Opcode.CONST, args=None, value=x)
+    return instr.replace(op=Opcode.ID, args=(instr.args[x],))
+
+
+def lvn(block: list[Instr], variables: VarTable, fresh_names: FreshNames) -> list[Instr]:
+    """Accepts a basic block and returns a copy rewritten using LVN. Variables overwritten later in the
+    block are renamed using `fresh_names` (new names are added to `variables`)"""
+    state = LVN([], [], {}, {})
+    names = variables.names
+    # Index of the last definition of each variable in the block, to know which ones are overwritten later
+    last_def = {}
+    for index, instr in enumerate(block):
+        if instr.flags & HAS_DEST:
+            last_def[instr.dest] = index
+
     new_block = []
     for index, instr in enumerate(block):
         if _ignore_instruction_lvn(instr):
-            new_instr = instr
+            new_block.append(instr)
+            continue
+
+        if instr.op != Opcode.CONST and instr.args:
+            # Map arguments to rows in the table
+            # Handle unknown variables which must have been defined in a prior block
+            for var in instr.args:
+                if var not in state.var_to_row:
+                    state.var_to_row[var] = state.add((), var)
+            if instr.flags & HAS_DEST:
+                # Replace the operation by a constant or a copy of one of its arguments when possible
+                instr = _fold(state, instr)
+
+        op = instr.op
+        if op == Opcode.CONST:
+            # const instructions have an explicit value
+            value = const_value(instr)
+        elif op == Opcode.CALL:
+            # Function calls are also identified by their functions
+            value = (instr.opname, " ".join(instr.funcs or ()), *[state.var_to_row[v] for v in instr.args or ()])
+        elif instr.flags & IS_PURE and instr.args and op != Opcode.PHI:
+            value = (instr.opname, *[state.var_to_row[v] for v in instr.args])
+            if op in COMMUTATIVE:
+                value = canonicalize(value)
         else:
-            if instr["op"] == "const":
-                # const instructions have an explicit value
-                value = (instr["op"], instr["type"], instr["value"])
-            elif "args" in instr:
-                # Other instructions we map arguments to rows in the table
-                # Handle unknown variables which must have been defined in a prior block
-                for var in [a for a in instr["args"] if a not in state.var_to_row]:
-                    state.var_to_row[var] = len(state.table)
-                    state.table.append(LVNRow((), var))
-                if instr["op"] == "call":
-                    value = (instr["op"], " ".join(instr["funcs"]), *[state.var_to_row[v] for v in instr["args"]])
-                else:
-                    value = (instr["op"], *[state.var_to_row[v] for v in instr["args"]])
-                    if instr["op"] in ["add", "mul", "eq", "and", "or"]:
-                        value = canonicalize(value)
-                        '''
-                        if instr["op"] in ["add","sub","mul","div"] and len(state.table[state.var_to_row[instr["args"][0]]].value)==3 and len(state.table[state.var_to_row[instr["args"][1]]].value)==3:
-                            # Handle constant folding
-                            if instr["op"] == "add":
-                                value = ("const", instr["type"], state.table[state.var_to_row[instr["args"][0]]].value[2] 
-                                        + state.table[state.var_to_row[instr["args"][1]]].value[2])
-                            if instr["op"] == "sub":
-                                value = ("const", instr["type"], state.table[state.var_to_row[instr["args"][0]]].value[2] 
-                                        - state.table[state.var_to_row[instr["args"][1]]].value[2])
-                            if instr["op"] == "mul":
-                                value = ("const", instr["type"], state.table[state.var_to_row[instr["args"][0]]].value[2] 
-                                        * state.table[state.var_to_row[instr["args"][1]]].value[2])
-                            if instr["op"] == "div":
-                                value = ("const", instr["type"], state.table[state.var_to_row[instr["args"][0]]].value[2] 
-                                        / state.table[state.var_to_row[instr["args"][1]]].value[2])
-                            instr = {"dest": instr["dest"], "op": "const", "type": instr["type"], "value": value[2]}
-                        '''
-            else:
-                # Handle function calls without args
-                value = (instr["op"], " ".join(instr["funcs"]))
-
-            if value in state.val_to_row and instr["op"] not in ["call", "alloc"]:
-                # Value has been computed before and is not a function call which may have side effects
-                var = state.table[state.val_to_row[value]].var
-                new_instr = {"args": [var], "dest": instr["dest"], "op": "id", "type": instr["type"]}
-                state.var_to_row[instr["dest"]] = state.val_to_row[value]
+            # Operations without args (e.g. SSA `get`, `undef`) and effects (e.g. `load`) aren't numbered:
+            # each result is a new value that is never looked up in the table
+            value = None
+
+        if value in state.val_to_row and op != Opcode.CALL and op != Opcode.ALLOC:
+            # Value has been computed before and is not a function call which may have side effects
+            row = state.val_to_row[value]
+            new_block.append(Instr(Opcode.ID, dest=instr.dest, type=instr.type, args=(state.vars[row],)))
+            state.var_to_row[instr.dest] = row
+            continue
+
+        # Replace args
+        new_args = instr.args
+        if new_args is not None:
+            new_args = tuple(state.vars[state.var_to_row[a]] for a in new_args)
+        new_dest = instr.dest
+        if instr.flags & HAS_DEST:
+            # Check if dest is overwritten later, conservatively assume value will be different
+            if last_def[instr.dest] > index:
+                # Generate new variable name
+                new_dest = variables.id(fresh_names(names[instr.dest]))
+
+            # New value
+            if op == Opcode.ID and state.values[state.var_to_row[instr.args[0]]]:
+                # Handle copy propagation except if the arg variable is unknown value
+                # Point these variables to the initial variable
+                state.var_to_row[instr.dest] = state.var_to_row[instr.args[0]]
+            elif value is None:
+                state.var_to_row[instr.dest] = state.add((instr.opname, index), new_dest)
             else:
-                new_instr = instr.copy()
-
-                # Replace args
-                if "args" in instr:
-                    new_instr["args"] = [state.table[state.var_to_row[a]].var for a in instr["args"]]
-
-                if "dest" in instr:
-                    # Check if dest is overwritten later, conservatively assume value will be different
-                    var_overwrites = [i["dest"] for i in block[index+1:] if "dest" in i]
-                    if instr["dest"] in var_overwrites:
-                        # Generate new variable name
-                        attempt = 1
-                        new_dest = f"{instr['dest']}_{attempt}"
-                        while new_dest in reserved_vars:
-                            attempt += 1
-                            new_dest = f"{instr['dest']}_{attempt}"
-                        reserved_vars.add(new_dest)
-                    else:
-                        new_dest = instr["dest"]
-                    new_instr["dest"] = new_dest
-                    
-                    # New value
-                    if instr["op"] == "id" and state.table[state.var_to_row[instr["args"][0]]].value:
-                        # Handle copy propagation except if the arg variable is unknown value
-                        # Point these variables to the initial variable
-                        state.var_to_row[instr["dest"]] = state.var_to_row[instr["args"][0]]
-                    else:
-                        state.val_to_row[value] = len(state.table)
-                        state.var_to_row[instr["dest"]] = len(state.table)
-                        state.table.append(LVNRow(value, new_dest))
-
-        new_block.append(new_instr)
+                row = state.add(value, new_dest)
+                state.val_to_row[value] = row
+                state.var_to_row[instr.dest] = row
+
+        if new_args == instr.args and new_dest == instr.dest:
+            new_block.append(instr)
+        else:
+            new_block.append(instr.replace(args=new_args, dest=new_dest))
     return new_block
 
 
-if __name__ == '__main__':
-    program = json.load(sys.stdin)
-    for function in program['functions']:
-        bbs = form_basic_blocks(function)
-        rvs = set(instr["dest"] for instr in function["instrs"] if "dest" in instr)
-        new_bbs = [lvn(b, rvs) for b in bbs]
-        function["instrs"] = []
-        for nbb in new_bbs:
-            function["instrs"].extend(nbb)
+def lvn_blocks(bbs: list[list[dict]], dce: bool = False) -> list[list[dict]]:
+    """Runs LVN on every basic block of a function and returns the rewritten blocks
+    (followed by trivial dead code elimination if `dce`)"""
+    variables = VarTable()
+    blocks = [[Instr.from_json(instr, variables, keep_source=True) for instr in bb] for bb in bbs]
+    fresh_names = FreshNames(set(instr["dest"] for bb in bbs for instr in bb if "dest" in instr))
+    blocks = [lvn(b, variables, fresh_names) for b in blocks]
+    if dce:
+        dead = iter(dead_instructions(blocks, len(variables)))
+        blocks = [[instr for instr in b if not next(dead)] for b in blocks]
+    return [[instr.to_json(variables) for instr in b] for b in blocks]
+
+
+def lvn_function(function: dict, dce: bool = False) -> list[dict]:
+    """The instructions of `function` after LVN (followed by trivial dead code elimination if `dce`)"""
+    instrs = []
+    for nbb in lvn_blocks(form_basic_blocks(function), dce):
+        instrs.extend(nbb)
+    return instrs
 
+
+if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--dce', action='store_true', help='Run dead code elimination')
+    add_jobs_argument(parser)
+    add_format_arguments(parser)
     args = parser.parse_args()
-    if args.dce:
-        #post-processing: trivial dead code elimination
-        tdce(program)
-    else:
-        json.dump(program, sys.stdout, indent=2)
\ No newline at end of file
+
+    # Functions are read, optimized and written out one at a time
+    stream_program(functools.partial(lvn_function, dce=args.dce), args)
\ No newline at end of file
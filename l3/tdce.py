@@ -1,57 +1,113 @@
-import json
+import argparse
+import os
 import sys
-from util import form_basic_blocks
+from cfg import form_basic_blocks
+
+# Parallel per-function execution and program I/O are shared with L4-L6
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+
+from bril_io import add_format_arguments, stream_program
+from bril_ir import HAS_DEST, Instr, VarTable
+from parallel import add_jobs_argument, map_functions
 
 # Program for trivial dead code elimination
+#
+# An instruction is dead if its destination is never used in the function (globally unused), or if it is
+# overwritten later in its block before being used (locally killed). Deleting an instruction removes uses of
+# its arguments, which can make other instructions dead: each variable's use count and, for each definition,
+# the number of uses before the next definition in the block are kept up to date, and instructions are
+# deleted from a worklist as soon as they become dead. Deleting a definition also links the definitions
+# before and after it in the block, so a previous definition with no uses left is killed by the next one.
+# Every instruction is deleted at most once, and blocks are compacted in a single pass at the end.
 
-basic_blocks = None
 
-def tdce_loop(func):
-    global basic_blocks
-    changed = False
-    used = set() # for globally unused vars
-    for basic_block in basic_blocks:
-        for instr in basic_block:
-            if 'args' in instr: 
-                used.update(instr['args'])
-    
-    for basic_block in basic_blocks:
-        last_def = dict() # for defined but unused vars (vars -> index of instr)
-        for i,instr in enumerate(basic_block):                
-            if 'args' in instr:
-                for arg in instr['args']:
-                    if arg in last_def: del last_def[arg]
-            
-            if 'dest' in instr:
-                var = instr['dest']
-                if var not in used:
-                    basic_block.remove(instr)
-                    changed = True
-                    
+def dead_instructions(blocks: list[list[Instr]], num_vars: int) -> list[bool]:
+    """Returns whether each instruction of the blocks (numbered in order across blocks) is dead.
+    Variables are the ids of a `VarTable` with `num_vars` entries"""
+    instrs = [instr for block in blocks for instr in block]
+    n = len(instrs)
+    uses = [0] * num_vars # Number of uses of each variable in the function
+    defs = [[] for _ in range(num_vars)] # Instructions defining each variable
+    next_def = [-1] * n # Next definition of the same variable in the block
+    prev_def = [-1] * n
+    local_uses = [0] * n # Uses of the variable between a definition and the next one in the block
+    owners = [()] * n # Definition in the block reaching each argument of an instruction (-1 if none)
+
+    i = 0
+    for block in blocks:
+        last_def = dict() # var -> index of its last definition so far in the block
+        for instr in block:
+            if instr.args:
+                owners[i] = [last_def.get(arg, -1) for arg in instr.args]
+                for arg, owner in zip(instr.args, owners[i]):
+                    uses[arg] += 1
+                    if owner != -1:
+                        local_uses[owner] += 1
+            if instr.flags & HAS_DEST:
+                var = instr.dest
+                defs[var].append(i)
                 if var in last_def:
-                    # var was previously defined, delete this prior instance
-                    index = last_def[var]
-                    del basic_block[index]
-                    del last_def[var]
-                    changed = True
-                    
+                    prev_def[i] = last_def[var]
+                    next_def[last_def[var]] = i
                 last_def[var] = i
+            i += 1
 
-    return changed
+    dead = [False] * n
+    worklist = [d for var, ds in enumerate(defs) for d in ds
+                if uses[var] == 0 or (next_def[d] != -1 and local_uses[d] == 0)]
+    while worklist:
+        i = worklist.pop()
+        if dead[i]:
+            continue
+        dead[i] = True
+        for arg, owner in zip(instrs[i].args or (), owners[i]):
+            uses[arg] -= 1
+            if uses[arg] == 0:
+                worklist.extend(defs[arg])
+            if owner != -1:
+                local_uses[owner] -= 1
+                if local_uses[owner] == 0 and next_def[owner] != -1:
+                    worklist.append(owner)
+        # Unlink the definition: a dead definition has no uses left before the next one, so the previous
+        # definition is now directly overwritten by the next one, which kills it if it has no uses either
+        prev, nxt = prev_def[i], next_def[i]
+        if nxt != -1:
+            prev_def[nxt] = prev
+        if prev != -1:
+            next_def[prev] = nxt
+            if local_uses[prev] == 0 and nxt != -1:
+                worklist.append(prev)
+    return dead
+
+
+def tdce_blocks(basic_blocks):
+    """Runs trivial dead code elimination to convergence on a function's basic blocks (in place)"""
+    variables = VarTable()
+    blocks = [[Instr.from_json(instr, variables) for instr in basic_block] for basic_block in basic_blocks]
+    dead = iter(dead_instructions(blocks, len(variables)))
+    for basic_block in basic_blocks:
+        basic_block[:] = [instr for instr in basic_block if not next(dead)]
+    return basic_blocks
     
     
-def tdce(program):
-    global basic_blocks
-    for func in program["functions"]:
-        # initialize basic blocks for this function
-        basic_blocks = form_basic_blocks(func)
-        # iterate until convergence
-        while tdce_loop(func):
-            pass
-        func['instrs'] = [x for xs in basic_blocks for x in xs] # flatten list
-    json.dump(program, sys.stdout, indent=2)
+def tdce_function(func) -> list[dict]:
+    """The instructions of `func` after trivial dead code elimination"""
+    basic_blocks = tdce_blocks(form_basic_blocks(func))
+    return [x for xs in basic_blocks for x in xs] # flatten list
+
+
+def tdce(program, jobs=1):
+    functions = program["functions"]
+    for func, instrs in zip(functions, map_functions(tdce_function, functions, jobs)):
+        func['instrs'] = instrs
+    return program
 
     
 if __name__ == '__main__':
-    program = json.load(sys.stdin)
-    tdce(program)
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    # The Bril test suite passes the pass name (e.g. `tdce+`); this always runs to convergence
+    parser.add_argument('mode', nargs='?', help='Ignored')
+    add_jobs_argument(parser)
+    add_format_arguments(parser)
+    args = parser.parse_args()
+    stream_program(tdce_function, args)
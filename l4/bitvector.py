@@ -0,0 +1,110 @@
+import unittest
+
+from live_vars import live_vars_transfer
+
+# Bit-vector representation of variable sets for gen/kill dataflow analyses.
+# Each variable of a function gets a dense index, and a set of variables is a Python int
+# whose i-th bit is set iff variable i is in the set, so merging becomes a bitwise OR (or AND)
+# and the transfer function of a block becomes `(out & ~kill) | gen`.
+
+
+class VarIndex:
+    """Dense numbering of the variables defined or used in a function"""
+
+    __slots__ = ("names", "index")
+
+    def __init__(self, basic_blocks: list[list[dict]], args: list[str] = ()):
+        self.names: list[str] = []
+        self.index: dict[str, int] = {}
+        for var in args:
+            self.add(var)
+        for block in basic_blocks:
+            for instr in block:
+                if "dest" in instr:
+                    self.add(instr["dest"])
+                for arg in instr.get("args", ()):
+                    self.add(arg)
+
+    def add(self, var: str) -> int:
+        i = self.index.get(var)
+        if i is None:
+            i = self.index[var] = len(self.names)
+            self.names.append(var)
+        return i
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def bit(self, var: str) -> int:
+        return 1 << self.index[var]
+
+    def from_set(self, variables) -> int:
+        bits = 0
+        for var in variables:
+            bits |= 1 << self.index[var]
+        return bits
+
+    def to_set(self, bits: int) -> set[str]:
+        variables = set()
+        while bits:
+            low = bits & -bits
+            variables.add(self.names[low.bit_length() - 1])
+            bits ^= low
+        return variables
+
+
+def union_merge(facts: list[int]) -> int:
+    """Merge for "may" analyses (e.g. live variables)"""
+    merged = 0
+    for bits in facts:
+        merged |= bits
+    return merged
+
+
+def live_vars_gen_kill(block: list[dict], index: VarIndex) -> tuple[int, int]:
+    """`(gen, kill)` of a block for live variables: the variables read before being
+    (re)defined in the block, and the variables it defines"""
+    gen, kill = 0, 0
+    # Walk the block backwards, like `live_vars_transfer`
+    for instr in reversed(block):
+        if "dest" in instr:
+            b = index.bit(instr["dest"])
+            gen &= ~b
+            kill |= b
+        for arg in instr.get("args", ()):
+            gen |= index.bit(arg)
+    return gen, kill
+
+
+def gen_kill_transfer(summary: tuple[int, int], bits: int) -> int:
+    """Transfer function of a block summarized as `(gen, kill)`"""
+    gen, kill = summary
+    return (bits & ~kill) | gen
+
+
+class TestBitVector(unittest.TestCase):
+    blocks = [
+        [{"dest": "a", "op": "const", "type": "int", "value": 1},
+         {"args": ["a", "b"], "dest": "c", "op": "add", "type": "int"},
+         {"args": ["c"], "dest": "a", "op": "id", "type": "int"}],
+        [{"args": ["a", "d"], "op": "print"}],
+    ]
+
+    def test_var_index(self):
+        index = VarIndex(self.blocks, args=["d"])
+        self.assertEqual(index.names, ["d", "a", "c", "b"])
+        self.assertEqual(index.to_set(index.from_set({"a", "c"})), {"a", "c"})
+        self.assertEqual(index.to_set(0), set())
+
+    def test_live_vars_transfer_matches_sets(self):
+        # Same results as the set-based transfer function
+        index = VarIndex(self.blocks, args=["d"])
+        for block in self.blocks:
+            summary = live_vars_gen_kill(block, index)
+            for out_vars in [set(), {"a"}, {"b", "d"}, {"a", "b", "c", "d"}]:
+                in_bits = gen_kill_transfer(summary, index.from_set(out_vars))
+                self.assertEqual(index.to_set(in_bits), live_vars_transfer(block, out_vars))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,16 +2,23 @@
 
 import argparse
 import json
+import os
 import sys
-from copy import deepcopy
 from typing import List, Dict, Optional, Tuple
 from cfg import build_cfg, form_basic_blocks
 from util import sorted_output
+from persistent_map import OverlayMap
 from functools import reduce
 
 import unittest
 from hypothesis import given, strategies as st
 
+# The worklist is shared with the other dataflow solvers
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+
+from csr_cfg import CSRCFG
+from worklist import ORDERS, make_worklist
+
 # Some type aliases to improve readibility + help with Mypy type checking
 
 # A Bril value is either an int or a bool
@@ -103,28 +110,61 @@ class TestMerge(unittest.TestCase):
         self.assertEqual(naive_dict_union, merged_dict)
 
 
+class TestTransfer(unittest.TestCase):
+    block = [
+        {"dest": "a", "op": "const", "type": "int", "value": 1},
+        {"args": ["a", "b"], "dest": "c", "op": "add", "type": "int"},
+        {"dest": "c", "op": "const", "type": "int", "value": 2},
+        {"args": ["c"], "dest": "a", "op": "id", "type": "int"},
+    ]
+
+    # Test that applying the block's summary gives the same output as the transfer function
+    @given(
+        st.dictionaries(
+            keys=st.sampled_from(["a", "b", "c", "d"]),
+            values=st.one_of(st.none(), st.integers(), st.booleans()),
+        )
+    )
+    def test_summary_matches_transfer(self, in_dict):
+        summary = const_prop_summary(self.block)
+        self.assertEqual(const_prop_apply(summary, in_dict), const_prop_transfer(self.block, in_dict))
+
+
 def const_prop_merge(
     dicts: List[Dict[Var, Optional[BrilValue]]],
-) -> Dict[Var, Optional[BrilValue]]:
+) -> OverlayMap:
     """Merge function for constant propagation: takes the union of all dicts
     contained within a list. Any keys that are mapped to different values
     within different dicts are automatically mapped to `None` in the output dict.
+    The result is an `OverlayMap` on top of the first dict, which only stores
+    the entries that differ from it.
 
     Args:
         dicts (List[Dict]): a list of dicts
 
     Returns:
-        Dict: the union of all the dicts
+        OverlayMap: the union of all the dicts
     """
-    output_dict: Dict[Var, Optional[BrilValue]] = dict()
-    for d in dicts:
-        for k in d.keys():
-            if k in output_dict:
-                if output_dict[k] != d[k]:
-                    output_dict[k] = None
+    if not dicts:
+        return OverlayMap()
+    first = OverlayMap.wrap(dicts[0])
+    # Flat copy of the first dict's entries for fast lookups (only `updates` is kept)
+    first_entries = first.to_dict() if len(dicts) > 1 else {}
+    updates: Dict[Var, Optional[BrilValue]] = dict()
+    for d in dicts[1:]:
+        if d is dicts[0]:
+            # e.g. several edges from the same predecessor
+            continue
+        for k, v in d.items():
+            if k in updates:
+                if updates[k] != v:
+                    updates[k] = None
+            elif k in first_entries:
+                if first_entries[k] != v:
+                    updates[k] = None
             else:
-                output_dict[k] = d[k]
-    return output_dict
+                updates[k] = v
+    return first.set_many(updates)
 
 
 def const_prop_transfer(
@@ -141,9 +181,8 @@ def const_prop_transfer(
         Dict: Updated map from variable names to (possibly `None`) values
     """
 
-    # Python's default `copy` method creates a shallow copy, whereas
-    # we want `out_dict` to be independent from `in_dict`, so we use `deepcopy`
-    out_dict = deepcopy(in_dict)
+    # Bril values are immutable, so a shallow copy makes `out_dict` independent from `in_dict`
+    out_dict = dict(in_dict)
     for instr in block:
         if "dest" in instr:
             dest = instr["dest"]
@@ -155,6 +194,34 @@ def const_prop_transfer(
     return out_dict
 
 
+def const_prop_summary(block: Block) -> Dict[Var, Optional[BrilValue]]:
+    """Summarizes a block as the map from each variable it defines to the
+    value of its last definition (`None` if that isn't a constant)"""
+    defs: Dict[Var, Optional[BrilValue]] = dict()
+    for instr in block:
+        if "dest" in instr:
+            defs[instr["dest"]] = instr["value"] if instr["op"] == "const" else None
+    return defs
+
+
+def const_prop_apply(
+    summary: Dict[Var, Optional[BrilValue]], in_dict: Dict[Var, Optional[BrilValue]]
+) -> OverlayMap:
+    """Same result as `const_prop_transfer`, given the block's summary.
+    The output shares all the entries the block doesn't redefine with `in_dict`"""
+    return OverlayMap.wrap(in_dict).set_many(summary)
+
+
+def const_prop_step(
+    instr: Instr, in_dict: Dict[Var, Optional[BrilValue]]
+) -> OverlayMap:
+    """Transfer function for a single instruction"""
+    if "dest" not in instr:
+        return OverlayMap.wrap(in_dict)
+    value = instr["value"] if instr["op"] == "const" else None
+    return OverlayMap.wrap(in_dict).set_many({instr["dest"]: value})
+
+
 def get_predecessors(blocks: List[Block], cfg: CFG) -> Dict[Idx, List[Idx]]:
     """Creates the predecessor dictionary for a CFG,
        mapping each node's index to a list of indices for its predecesssor
@@ -174,7 +241,7 @@ def get_predecessors(blocks: List[Block], cfg: CFG) -> Dict[Idx, List[Idx]]:
 
 
 def const_prop(
-    blocks: List[Block], cfg: CFG
+    blocks: List[Block], cfg: CFG, order: str = "scc"
 ) -> Tuple[
     Dict[Idx, Dict[Var, Optional[BrilValue]]],
     Dict[Idx, Dict[Var, Optional[BrilValue]]],
@@ -184,6 +251,8 @@ def const_prop(
     Args:
         blocks (List[Block]): list of basic blocks
         cfg (CFG): the CFG
+        order (str): worklist visit order, one of `worklist.ORDERS`
+                     (by default, one SCC at a time in topological order)
 
     Returns:
         A pair consisting of `(block_in, block_out)` (two dictionaries which map
@@ -203,14 +272,15 @@ def const_prop(
     }
 
     preds = get_predecessors(blocks, cfg)
+    summaries = [const_prop_summary(block) for block in blocks]
 
-    worklist = set(range(len(blocks) + 1))
+    worklist = make_worklist(CSRCFG.from_dict(cfg), 0, True, order)
     while len(worklist) > 0:
         b_idx = worklist.pop()
         block_in[b_idx] = const_prop_merge([block_out[p] for p in preds[b_idx]])
         original_block_out = block_out[b_idx]
         if b_idx < n:
-            block_out[b_idx] = const_prop_transfer(blocks[b_idx], block_in[b_idx])
+            block_out[b_idx] = const_prop_apply(summaries[b_idx], block_in[b_idx])
         else:
             # Handle fake last block
             block_out[b_idx] = block_in[b_idx]
@@ -225,6 +295,7 @@ if __name__ == "__main__":
     # Set up an optional cmd-line argument `--test` that runs the test suite
     parser = argparse.ArgumentParser()
     parser.add_argument("--test", action="store_true", help="Run Hypothesis tests")
+    parser.add_argument("--order", choices=ORDERS, default="scc", help="Worklist visit order")
     args = parser.parse_args()
 
     if args.test:
@@ -234,7 +305,7 @@ if __name__ == "__main__":
         for func in program["functions"]:
             blocks = form_basic_blocks(func)
             cfg = build_cfg(blocks)
-            block_in, block_out = const_prop(blocks, cfg)
+            block_in, block_out = const_prop(blocks, cfg, order=args.order)
             print(func["name"])
             for i in range(len(blocks) + 1):
                 if i < len(blocks):
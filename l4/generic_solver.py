@@ -1,12 +1,30 @@
+import os
 import sys
-import json
+import argparse
+import functools
+import heapq
+import io
+import time
+import unittest
+from collections import OrderedDict
 from dataclasses import dataclass
 from typing import Any, Callable
-from cfg import build_cfg, form_basic_blocks
+from cfg import form_basic_blocks
 
-from live_vars import live_vars_transfer, live_vars_merge
-from const_prop import const_prop_transfer, const_prop_merge
+from live_vars import live_vars_summary, live_vars_apply, live_vars_merge, live_vars_step
+from const_prop import const_prop_summary, const_prop_apply, const_prop_merge, const_prop_step
 from util import sorted_output
+from bitvector import VarIndex, union_merge, live_vars_gen_kill, gen_kill_transfer
+from batched_solver import BATCHED_EXAMPLES, batched_dataflow
+from solver_stats import STATS_FORMATS, DataflowStats, write_stats
+
+# The array-backed CFG representation is shared with L5/L6
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+
+from csr_cfg import CSRCFG, build_csr_cfg
+from worklist import ORDERS, PriorityWorklist, SCCWorklist, make_worklist, node_ranks
+from parallel import add_jobs_argument, imap_functions
+from bril_io import add_format_arguments, program_reader
 
 # Implemention of a generic solver that supports multiple analyses
 
@@ -16,42 +34,226 @@ class Analysis:
     init: Any
     merge: Callable
     transfer: Callable
+    # Optional `block -> summary` hook, called once per block before solving.
+    # When it is set, `transfer` is called with the block's summary instead of the block
+    summarize: Callable | None = None
+    # Optional `(instruction, fact) -> fact` transfer function for a single instruction
+    # (in the direction of the analysis), needed for `ProgramPoints` queries
+    step: Callable | None = None
 
-def dataflow(basic_blocks: list[list[dict]], _cfg: dict, analysis: Analysis):
-    # Reverse cfg to obtain predecessor maps
-    _pred_cfg = {i: [] for i in range(len(basic_blocks)+1)}
-    for k, v in _cfg.items():
-        for i in v:
-            _pred_cfg[i].append(k)
+def dataflow(basic_blocks: list[list[dict]], _cfg: dict | CSRCFG, analysis: Analysis, order: str = "scc",
+             scc_report: list | None = None, stats: DataflowStats | None = None):
+    """Solves `analysis` over the basic blocks, returns the `(block_in, block_out)` maps.
+    `order` is the worklist visit order (see `worklist.ORDERS`). By default the strongly
+    connected components of the CFG are solved one at a time, in topological order.
+    With `order="scc"`, a `scc_report` list is filled with one `(blocks, visits)` pair per
+    strongly connected component (in the order they were solved).
+    If `stats` is given, it records the work done by the solver (see `solver_stats.DataflowStats`)"""
+    # Successors and predecessors both come from the CSR buffers
+    graph = CSRCFG.from_dict(_cfg)
+    worklist = make_worklist(graph, 0, analysis.forward, order)
     
     # Set up cfg, block_in, block_out maps and worklist
     if analysis.forward:
-        cfg, pred_cfg = _cfg, _pred_cfg
         block_in : dict[int, set[str]] = {0 : analysis.init}
         block_out : dict[int, set[str]] = {b: analysis.init for b in range(len(basic_blocks) + 1)}
     else:
         # Imagine them as reversed
-        cfg, pred_cfg = _pred_cfg, _cfg
+        graph = graph.reversed()
         block_in : dict[int, set[str]] = {len(basic_blocks): analysis.init}
         block_out: dict[int, set[str]] = {b: analysis.init for b in range(len(basic_blocks) + 1)}
     
-    # Iterate through the basic blocks list
-    worklist = set(range(len(basic_blocks)+1))
+    # Blocks don't change while solving, so they only need to be summarized once
+    if analysis.summarize is not None:
+        blocks = [analysis.summarize(block) for block in basic_blocks]
+    else:
+        blocks = basic_blocks
+
+    if stats is None:
+        _iterate(graph, blocks, analysis, block_in, block_out, worklist)
+    else:
+        stats.reset(graph.n)
+        _iterate_with_stats(graph, blocks, analysis, block_in, block_out, worklist, stats)
+
+    if scc_report is not None and isinstance(worklist, SCCWorklist):
+        scc_report.extend(zip(worklist.components, worklist.visits))
+
+    if analysis.forward:
+        return block_in, block_out
+    else:
+        return block_out, block_in
+
+
+def _iterate(graph: CSRCFG, blocks: list, analysis: Analysis, block_in: dict, block_out: dict, worklist, within=None):
+    """Runs the worklist algorithm until `worklist` is empty. `graph` is oriented in the direction
+    of the analysis, and its last node is the dummy exit (entry, for backward analyses) node.
+    If `within` is given, only nodes `v` with `within(v)` are added back to the worklist.
+    Returns the number of nodes taken off the worklist"""
+    n = len(blocks)
+    visits = 0
     while worklist:
         i = worklist.pop()
-        block_in[i] = analysis.merge([block_out[s] for s in pred_cfg[i]])
+        visits += 1
+        block_in[i] = analysis.merge([block_out[s] for s in graph.predecessors(i)])
         orig_block_out = block_out[i]
-        if i < len(basic_blocks):
-            block_out[i] = analysis.transfer(basic_blocks[i], block_in[i])
+        if i < n:
+            block_out[i] = analysis.transfer(blocks[i], block_in[i])
         else:
             block_out[i] = block_in[i]
         if block_out[i] != orig_block_out:
-            worklist.update(set(cfg[i]))
+            if within is None:
+                worklist.update(graph.successors(i))
+            else:
+                worklist.update(s for s in graph.successors(i) if within(s))
+    return visits
+
+
+def _iterate_with_stats(graph: CSRCFG, blocks: list, analysis: Analysis, block_in: dict, block_out: dict, worklist,
+                        stats: DataflowStats) -> int:
+    """Same as `_iterate`, but counts and times the calls to the analysis' functions in `stats`"""
+    n = len(blocks)
+    clock = time.perf_counter
+    while worklist:
+        i = worklist.pop()
+        stats.pops += 1
+        start = clock()
+        block_in[i] = analysis.merge([block_out[s] for s in graph.predecessors(i)])
+        stats.merge_time += clock() - start
+        stats.merge_calls[i] += 1
+        orig_block_out = block_out[i]
+        if i < n:
+            start = clock()
+            block_out[i] = analysis.transfer(blocks[i], block_in[i])
+            stats.transfer_time += clock() - start
+            stats.transfer_calls[i] += 1
+        else:
+            block_out[i] = block_in[i]
+        stats.record_fact(block_in[i])
+        stats.record_fact(block_out[i])
+        if block_out[i] != orig_block_out:
+            stats.out_changes[i] += 1
+            worklist.update(graph.successors(i))
+    return stats.pops
+
+
+class IncrementalDataflow:
+    """Dataflow solution that is kept up to date as blocks get rewritten.
+
+    The solution is computed one strongly connected component at a time (like `order="scc"`).
+    After `update(basic_blocks, changed)`, only the components containing a changed block are
+    solved again from scratch, followed by the components downstream of them whose inputs
+    changed as a result, so the result is always identical to a full solve.
+    The blocks may change but the CFG must stay the same."""
+
+    def __init__(self, basic_blocks: list[list[dict]], _cfg: dict | CSRCFG, analysis: Analysis):
+        self.analysis = analysis
+        graph = CSRCFG.from_dict(_cfg)
+        rank = node_ranks(graph, 0, analysis.forward)
+        # The graph the facts flow along
+        self.graph = graph if analysis.forward else graph.reversed()
+        self.components = [sorted(c, key=rank.__getitem__) for c in self.graph.sccs()]
+        self.component_of = [0] * graph.n
+        for c, component in enumerate(self.components):
+            for v in component:
+                self.component_of[v] = c
+        self.rank = rank
+        self.blocks = [self._summarize(block) for block in basic_blocks]
+        self.block_in = {}
+        self.block_out = {b: analysis.init for b in range(graph.n)}
+        # Number of transfer function applications (i.e. block visits), over all solves
+        self.visits = 0
+        self._solve_from(range(len(self.components)))
+
+    def _summarize(self, block: list[dict]):
+        return self.analysis.summarize(block) if self.analysis.summarize is not None else block
+
+    def _solve_component(self, c: int) -> list[int]:
+        """Solves component `c` from scratch, assuming everything upstream is up to date.
+        Returns the nodes of the component whose output changed"""
+        component = self.components[c]
+        before = [self.block_out[v] for v in component]
+        for v in component:
+            self.block_out[v] = self.analysis.init
+        component_of = self.component_of
+        self.visits += _iterate(self.graph, self.blocks, self.analysis, self.block_in, self.block_out,
+                                PriorityWorklist(self.rank, component), within=lambda v: component_of[v] == c)
+        return [v for v, old in zip(component, before) if self.block_out[v] != old]
+
+    def _solve_from(self, components) -> set[int]:
+        """Solves the given components, then every component downstream whose inputs changed.
+        Returns the set of nodes whose output changed"""
+        heap = list(set(components))
+        heapq.heapify(heap)
+        queued = set(heap)
+        changed = set()
+        while heap:
+            c = heapq.heappop(heap)
+            for v in self._solve_component(c):
+                changed.add(v)
+                # Components are in topological order, so successors come later
+                for s in self.graph.successors(v):
+                    d = self.component_of[s]
+                    if d != c and d not in queued:
+                        queued.add(d)
+                        heapq.heappush(heap, d)
+        return changed
+
+    def update(self, basic_blocks: list[list[dict]], changed_blocks) -> set[int]:
+        """Updates the solution after the blocks in `changed_blocks` were rewritten.
+        Returns the set of nodes whose output (input, for backward analyses) changed"""
+        # `changed_blocks` may be a one-shot iterator, and it's needed twice
+        changed = list(changed_blocks)
+        for b in changed:
+            self.blocks[b] = self._summarize(basic_blocks[b])
+        return self._solve_from(self.component_of[b] for b in changed)
+
+    def result(self) -> tuple[dict, dict]:
+        """The `(block_in, block_out)` maps, as returned by `dataflow`"""
+        block_in, block_out = dict(self.block_in), dict(self.block_out)
+        if self.analysis.forward:
+            return block_in, block_out
+        else:
+            return block_out, block_in
 
-    if analysis.forward:
-        return block_in, block_out
-    else:
-        return block_out, block_in
+
+class ProgramPoints:
+    """Facts at individual instructions, derived on demand from the block-level solution
+    (`block_in`, `block_out` as returned by `dataflow`) by applying `analysis.step`.
+    `at(b, i)` is the fact just before the `i`-th instruction of block `b` (or at the end
+    of the block, for `i == len(block)`). The last `cache_size` queried points are memoized"""
+
+    def __init__(self, basic_blocks: list[list[dict]], analysis: Analysis, block_in: dict, block_out: dict,
+                 cache_size: int = 1024):
+        if analysis.step is None:
+            raise ValueError("program point queries need an analysis with a `step` function")
+        self.basic_blocks = basic_blocks
+        self.analysis = analysis
+        self.block_in = block_in
+        self.block_out = block_out
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple[int, int], Any] = OrderedDict()
+
+    def at(self, b: int, i: int):
+        key = (b, i)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        block = self.basic_blocks[b]
+        if not 0 <= i <= len(block):
+            raise IndexError(f"block {b} has no instruction {i}")
+        step = self.analysis.step
+        if self.analysis.forward:
+            fact = self.block_in[b]
+            for instr in block[:i]:
+                fact = step(instr, fact)
+        else:
+            fact = self.block_out[b]
+            for instr in reversed(block[i:]):
+                fact = step(instr, fact)
+        self._cache[key] = fact
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return fact
 
 
 DF_EXAMPLES = {
@@ -59,29 +261,244 @@ DF_EXAMPLES = {
         forward=False,
         init=set(),
         merge=live_vars_merge,
-        transfer=live_vars_transfer
+        transfer=live_vars_apply,
+        summarize=live_vars_summary,
+        step=live_vars_step
     ),
     
     "const": Analysis(
         forward=True,
         init=dict(),
         merge=const_prop_merge,
-        transfer=const_prop_transfer
+        transfer=const_prop_apply,
+        summarize=const_prop_summary,
+        step=const_prop_step
     )
 }
 
 
+# Bit-vector versions of the gen/kill analyses above. Variables are numbered per function,
+# so these build the `Analysis` for a given function (and the `VarIndex` to decode facts)
+def live_vars_bitvector(basic_blocks: list[list[dict]], func_args: list[str] = ()) -> tuple[Analysis, VarIndex]:
+    index = VarIndex(basic_blocks, func_args)
+    analysis = Analysis(
+        forward=False,
+        init=0,
+        merge=union_merge,
+        transfer=gen_kill_transfer,
+        summarize=lambda block: live_vars_gen_kill(block, index),
+        step=lambda instr, bits: gen_kill_transfer(live_vars_gen_kill([instr], index), bits)
+    )
+    return analysis, index
+
+
+BITVECTOR_EXAMPLES = {
+    "live": live_vars_bitvector,
+}
+
+
+class TestIncrementalDataflow(unittest.TestCase):
+    # @main { x = 1; i = 0; .loop: br c .body .done; .body: i = i + x; jmp .loop; .done: y = 2; print i; }
+    def blocks(self):
+        return [
+            [{"dest": "x", "op": "const", "type": "int", "value": 1},
+             {"dest": "i", "op": "const", "type": "int", "value": 0}],
+            [{"label": "loop"},
+             {"args": ["c"], "labels": ["body", "done"], "op": "br"}],
+            [{"label": "body"},
+             {"args": ["i", "x"], "dest": "i", "op": "add", "type": "int"},
+             {"labels": ["loop"], "op": "jmp"}],
+            [{"label": "done"},
+             {"dest": "y", "op": "const", "type": "int", "value": 2},
+             {"args": ["i"], "op": "print"}],
+        ]
+
+    def assert_same_as_full_solve(self, blocks, solver, analysis):
+        self.assertEqual(solver.result(), dataflow(blocks, build_csr_cfg(blocks), analysis))
+
+    def test_removed_use_is_no_longer_live(self):
+        blocks = self.blocks()
+        solver = IncrementalDataflow(blocks, build_csr_cfg(blocks), DF_EXAMPLES["live"])
+        self.assertIn("x", solver.result()[0][1])
+        # `i = i + x` -> `i = i + i`: `x` is no longer live around the loop, even though
+        # the old solution (where `x` is live at the loop header) is self-consistent
+        blocks[2][1]["args"] = ["i", "i"]
+        solver.update(blocks, {2})
+        self.assertNotIn("x", solver.result()[0][1])
+        self.assert_same_as_full_solve(blocks, solver, DF_EXAMPLES["live"])
+
+    def test_changed_constant(self):
+        blocks = self.blocks()
+        solver = IncrementalDataflow(blocks, build_csr_cfg(blocks), DF_EXAMPLES["const"])
+        blocks[0][0]["value"] = 5
+        # `x` is constant everywhere, so every output changes
+        self.assertEqual(solver.update(blocks, {0}), {0, 1, 2, 3, 4})
+        self.assert_same_as_full_solve(blocks, solver, DF_EXAMPLES["const"])
+
+    def test_only_downstream_blocks_are_revisited(self):
+        blocks = self.blocks()
+        solver = IncrementalDataflow(blocks, build_csr_cfg(blocks), DF_EXAMPLES["const"])
+        visits = solver.visits
+        # Only the exit block (and the dummy exit node) come after `.done`
+        blocks[3][1]["value"] = 3
+        solver.update(blocks, {3})
+        self.assertEqual(solver.visits - visits, 2)
+        self.assert_same_as_full_solve(blocks, solver, DF_EXAMPLES["const"])
+
+    def test_changed_blocks_can_be_a_generator(self):
+        blocks = self.blocks()
+        solver = IncrementalDataflow(blocks, build_csr_cfg(blocks), DF_EXAMPLES["const"])
+        blocks[0][0]["value"] = 5
+        self.assertEqual(solver.update(blocks, (b for b in [0])), {0, 1, 2, 3, 4})
+        self.assertEqual(solver.result()[1][3]["x"], 5)
+        self.assert_same_as_full_solve(blocks, solver, DF_EXAMPLES["const"])
+
+
+class TestProgramPoints(unittest.TestCase):
+    blocks = TestIncrementalDataflow.blocks
+
+    def test_live_vars_at_instructions(self):
+        blocks = self.blocks()
+        block_in, block_out = dataflow(blocks, build_csr_cfg(blocks), DF_EXAMPLES["live"])
+        facts = ProgramPoints(blocks, DF_EXAMPLES["live"], block_in, block_out)
+        for b, block in enumerate(blocks):
+            self.assertEqual(facts.at(b, 0), block_in[b])
+            self.assertEqual(facts.at(b, len(block)), block_out[b])
+        # Just before `i = 0`, `i` isn't live but `x` (used in the loop) is
+        self.assertEqual(facts.at(0, 1), {"c", "x"})
+        self.assertEqual(facts.at(2, 2), {"c", "i", "x"})
+        self.assertEqual(facts.at(3, 1), {"i"})
+
+    def test_const_prop_at_instructions(self):
+        blocks = self.blocks()
+        block_in, block_out = dataflow(blocks, build_csr_cfg(blocks), DF_EXAMPLES["const"])
+        facts = ProgramPoints(blocks, DF_EXAMPLES["const"], block_in, block_out)
+        for b, block in enumerate(blocks):
+            self.assertEqual(facts.at(b, 0), block_in[b])
+            self.assertEqual(facts.at(b, len(block)), block_out[b])
+        self.assertEqual(facts.at(0, 1), {"x": 1})
+        self.assertEqual(facts.at(3, 2), {"x": 1, "i": None, "y": 2})
+
+    def test_cache_is_bounded(self):
+        blocks = self.blocks()
+        analysis, index = live_vars_bitvector(blocks)
+        block_in, block_out = dataflow(blocks, build_csr_cfg(blocks), analysis)
+        facts = ProgramPoints(blocks, analysis, block_in, block_out, cache_size=2)
+        self.assertEqual(index.to_set(facts.at(2, 1)), {"c", "i", "x"})
+        facts.at(2, 2)
+        facts.at(3, 0)
+        self.assertEqual(list(facts._cache), [(2, 2), (3, 0)])
+        with self.assertRaises(IndexError):
+            facts.at(0, 3)
+
+
+def print_result(func_name: str, basic_blocks: list[list[dict]], b_in, b_out, out=sys.stdout) -> None:
+    print(func_name, file=out)
+    for i in range(len(basic_blocks)+1):
+        if i < len(basic_blocks):
+            print(basic_blocks[i][0].get("label", f"b{i}"), file=out)
+        else:
+            print(f"b{i}", file=out)
+        print(f"\tin: {sorted_output(b_in[i])}", file=out)
+        print(f"\tout: {sorted_output(b_out[i])}", file=out)
+
+
+def solve_function(func: dict, args: argparse.Namespace) -> tuple[str, str, DataflowStats | None]:
+    """Runs the analysis chosen on the command line over one function.
+    Returns its printed result, its SCC report (if requested) and its stats (if requested)"""
+    basic_blocks = form_basic_blocks(func)
+    cfg = build_csr_cfg(basic_blocks)
+    scc_report = []
+    stats = DataflowStats(func["name"]) if args.stats else None
+    if args.bitvector:
+        args_names = [arg["name"] for arg in func.get("args", [])]
+        analysis, index = BITVECTOR_EXAMPLES[args.analysis](basic_blocks, args_names)
+        b_in, b_out = dataflow(basic_blocks, cfg, analysis, order=args.order, scc_report=scc_report, stats=stats)
+        b_in = {i: index.to_set(bits) for i, bits in b_in.items()}
+        b_out = {i: index.to_set(bits) for i, bits in b_out.items()}
+    else:
+        b_in, b_out = dataflow(basic_blocks, cfg, DF_EXAMPLES[args.analysis], order=args.order,
+                               scc_report=scc_report, stats=stats)
+    out = io.StringIO()
+    print_result(func["name"], basic_blocks, b_in, b_out, out)
+    report = io.StringIO()
+    if args.scc_report:
+        # Blocks outside of loops are only visited once, so only report the loops
+        for blocks, visits in scc_report:
+            if len(blocks) > 1 or visits > 1:
+                print(f"{func['name']}: SCC {sorted(blocks)}: {visits} visits", file=report)
+        print(f"{func['name']}: {sum(v for _, v in scc_report)} visits in total, {len(scc_report)} SCCs", file=report)
+    return out.getvalue(), report.getvalue(), stats
+
+
+class TestSolverStats(unittest.TestCase):
+    def test_stats_do_not_change_results(self):
+        blocks = TestIncrementalDataflow.blocks(self)
+        for name, analysis in DF_EXAMPLES.items():
+            stats = DataflowStats(name)
+            result = dataflow(blocks, build_csr_cfg(blocks), analysis, stats=stats)
+            self.assertEqual(result, dataflow(blocks, build_csr_cfg(blocks), analysis))
+            self.assertEqual(stats.pops, sum(stats.merge_calls))
+            # Every block is transferred at least once, the loop body more than once
+            self.assertEqual(len(stats.transfer_calls), len(blocks) + 1)
+            self.assertTrue(all(calls >= 1 for calls in stats.transfer_calls[:len(blocks)]))
+            self.assertGreater(stats.transfer_calls[2], 1)
+
+    def test_peak_fact_size(self):
+        blocks = TestIncrementalDataflow.blocks(self)
+        stats = DataflowStats("main")
+        dataflow(blocks, build_csr_cfg(blocks), DF_EXAMPLES["live"], stats=stats)
+        # c, i and x are live at the start of the loop
+        self.assertEqual(stats.peak_fact_size, 3)
+
+
 if __name__ == "__main__":
-    program = json.load(sys.stdin)
-    for func in program["functions"]:
-        basic_blocks = form_basic_blocks(func)
-        cfg = build_cfg(basic_blocks)
-        b_in, b_out = dataflow(basic_blocks, cfg, DF_EXAMPLES[sys.argv[1]])
-        print(func["name"])
-        for i in range(len(basic_blocks)+1):
-            if i < len(basic_blocks):
-                print(basic_blocks[i][0].get("label", f"b{i}"))
-            else:
-                print(f"b{i}")
-            print(f"\tin: {sorted_output(b_in[i])}")
-            print(f"\tout: {sorted_output(b_out[i])}")
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--test", action="store_true", help="Runs unit tests")
+    parser.add_argument("analysis", nargs="?", choices=list(DF_EXAMPLES), help="Dataflow analysis to run")
+    parser.add_argument("--order", choices=ORDERS, default="scc", help="Worklist visit order")
+    parser.add_argument("--bitvector", action="store_true", help="Use the bit-vector version of the analysis")
+    parser.add_argument("--batched", action="store_true", help="Solve all functions at once with the (NumPy) batched gen/kill solver")
+    parser.add_argument("--stats", choices=STATS_FORMATS, help="Write solver statistics for each function to stderr in this format")
+    add_jobs_argument(parser)
+    add_format_arguments(parser, output=False)
+    parser.add_argument("--scc-report", action="store_true", help="With --order scc, report the block visits per SCC on stderr")
+    args = parser.parse_args()
+    if args.test:
+        unittest.main(argv=["first-arg-is-ignored"])
+    if args.analysis is None:
+        parser.error("the analysis to run is required")
+    if args.bitvector and args.analysis not in BITVECTOR_EXAMPLES:
+        parser.error(f"no bit-vector version of '{args.analysis}' (choose from {', '.join(BITVECTOR_EXAMPLES)})")
+    if args.batched and args.analysis not in BATCHED_EXAMPLES:
+        parser.error(f"no batched version of '{args.analysis}' (choose from {', '.join(BATCHED_EXAMPLES)})")
+    if args.batched and args.stats:
+        parser.error("--stats is not supported by the batched solver")
+
+    functions = program_reader(sys.stdin, args.in_format).functions()
+    if args.batched:
+        # Build the gen/kill problem of every function, and solve them all at once
+        build_problem, forward = BATCHED_EXAMPLES[args.analysis]
+        solved, problems = [], []
+        for func in functions:
+            basic_blocks = form_basic_blocks(func)
+            args_names = [arg["name"] for arg in func.get("args", [])]
+            problem, index = build_problem(basic_blocks, build_csr_cfg(basic_blocks), args_names)
+            solved.append((func, basic_blocks, index))
+            problems.append(problem)
+        results, iterations = batched_dataflow(problems, forward=forward)
+        for (func, basic_blocks, index), (b_in, b_out) in zip(solved, results):
+            print_result(func["name"], basic_blocks, [index.to_set(bits) for bits in b_in], [index.to_set(bits) for bits in b_out])
+        sys.exit()
+
+    all_stats = []
+    # Functions are read and solved one at a time
+    results = imap_functions(functools.partial(solve_function, args=args), functions, args.jobs)
+    for output, report, stats in results:
+        sys.stdout.write(output)
+        sys.stderr.write(report)
+        if stats is not None:
+            all_stats.append(stats)
+
+    if args.stats:
+        write_stats(all_stats, sys.stderr, args.stats)
@@ -1,9 +1,17 @@
+import argparse
 import json
+import os
 import sys
 
 from cfg import build_cfg, form_basic_blocks
 from util import sorted_output
 
+# The worklist is shared with the other dataflow solvers
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+
+from csr_cfg import CSRCFG
+from worklist import ORDERS, make_worklist
+
 
 def live_vars_merge(sets: list[set]) -> set:
     """Return a set that is the union of the input list of sets"""
@@ -27,7 +35,36 @@ def live_vars_transfer(block: list[dict], out_vars: set) -> set:
     return in_vars
 
 
-def live_variables(blocks: list[list[dict]], cfg: dict) -> tuple[dict, dict]:
+def live_vars_step(instr: dict, live_after: set) -> set:
+    """Live variables just before `instr`, given the ones live just after it"""
+    live_before = live_after.copy()
+    if "dest" in instr:
+        live_before.discard(instr["dest"])
+    if "args" in instr:
+        live_before.update(instr["args"])
+    return live_before
+
+
+def live_vars_summary(block: list[dict]) -> tuple[set, set]:
+    """Summarizes a block as `(gen, kill)`: the variables it reads before (re)defining them,
+    and the variables it defines. Same walk as `live_vars_transfer`, done once per block"""
+    gen, kill = set(), set()
+    for instr in reversed(block):
+        if "dest" in instr:
+            gen.discard(instr["dest"])
+            kill.add(instr["dest"])
+        if "args" in instr:
+            gen.update(instr["args"])
+    return gen, kill
+
+
+def live_vars_apply(summary: tuple[set, set], out_vars: set) -> set:
+    """Same result as `live_vars_transfer`, given the block's summary"""
+    gen, kill = summary
+    return (out_vars - kill) | gen
+
+
+def live_variables(blocks: list[list[dict]], cfg: dict, order: str = "scc") -> tuple[dict, dict]:
     # Maps block to in set of live vars
     block_in : dict[int, set[str]] = {b: set() for b in range(len(blocks)+1)}
     # Maps block to out set of live vars
@@ -39,13 +76,16 @@ def live_variables(blocks: list[list[dict]], cfg: dict) -> tuple[dict, dict]:
         for i in v:
             pred_cfg[i].append(k)
 
-    worklist = set(range(len(blocks)+1))
+    summaries = [live_vars_summary(block) for block in blocks]
+
+    # Backward analysis: by default loops (SCCs) are solved from the exit up to the entry
+    worklist = make_worklist(CSRCFG.from_dict(cfg), 0, False, order)
     while worklist:
         i = worklist.pop()
         block_out[i] = live_vars_merge([block_in[s] for s in cfg[i]])
         orig_block_in = block_in[i]
         if i < len(blocks):
-            block_in[i] = live_vars_transfer(blocks[i], block_out[i])
+            block_in[i] = live_vars_apply(summaries[i], block_out[i])
         else:
             # fake last block
             block_in[i] = block_out[i]
@@ -57,11 +97,15 @@ def live_variables(blocks: list[list[dict]], cfg: dict) -> tuple[dict, dict]:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--order", choices=ORDERS, default="scc", help="Worklist visit order")
+    args = parser.parse_args()
+
     program = json.load(sys.stdin)
     for func in program["functions"]:
         bbs = form_basic_blocks(func)
         c = build_cfg(bbs)
-        b_in, b_out = live_variables(bbs, c)
+        b_in, b_out = live_variables(bbs, c, order=args.order)
         print(func["name"])
         for i in range(len(bbs)+1):
             if i < len(bbs):
@@ -0,0 +1,169 @@
+import math
+import unittest
+from collections.abc import Mapping
+
+# Immutable, structurally shared maps for map-lattice dataflow analyses (e.g. constant propagation).
+#
+# An `OverlayMap` is a (small) dict of `delta` entries layered on top of a `base` map,
+# so "copy `in` and update a few variables" allocates only the updated entries and
+# shares everything else with `in`. Chains are flattened once they get too deep,
+# to keep lookups fast.
+
+_MISSING = object()
+
+
+def _same(a, b) -> bool:
+    # `1 == True` and `0.0 == -0.0` in Python, but they are different Bril values
+    if a is b:
+        return True
+    if type(a) is not type(b) or a != b:
+        return False
+    return type(a) is not float or math.copysign(1.0, a) == math.copysign(1.0, b)
+
+
+def _same_entries(a: Mapping, b: Mapping) -> bool:
+    return len(a) == len(b) and all(_same(v, b.get(k, _MISSING)) for k, v in a.items())
+
+
+class OverlayMap(Mapping):
+    """Immutable map made of the entries in `delta` on top of `base` (another `OverlayMap`,
+    a plain dict that must not be mutated afterwards, or `None` for an empty map)"""
+
+    __slots__ = ("base", "delta", "depth")
+
+    # Maximum number of overlays on top of a plain dict before flattening
+    MAX_DEPTH = 8
+
+    def __init__(self, entries: Mapping | None = None):
+        self.base = None
+        self.delta = dict(entries) if entries else {}
+        self.depth = 0
+
+    @classmethod
+    def wrap(cls, m: Mapping) -> "OverlayMap":
+        """`m` itself if it already is an `OverlayMap`, otherwise a map sharing `m`'s entries (without copying them)"""
+        if isinstance(m, OverlayMap):
+            return m
+        overlay = cls.__new__(cls)
+        overlay.base, overlay.delta, overlay.depth = None, m, 0
+        return overlay
+
+    def set_many(self, updates: Mapping) -> "OverlayMap":
+        """A new map with `updates` applied, sharing the unchanged entries with this one.
+        Returns this map itself if none of the updates changes anything"""
+        get = self.get
+        delta = {}
+        for k, v in updates.items():
+            current = get(k, _MISSING)
+            if not _same(current, v):
+                delta[k] = v
+        if not delta:
+            return self
+        overlay = OverlayMap.__new__(OverlayMap)
+        if self.depth >= OverlayMap.MAX_DEPTH:
+            overlay.base, overlay.depth = OverlayMap.wrap(self.to_dict()), 1
+        else:
+            overlay.base, overlay.depth = self, self.depth + 1
+        overlay.delta = delta
+        return overlay
+
+    def to_dict(self) -> dict:
+        layers = []
+        m = self
+        while m is not None:
+            layers.append(m.delta)
+            m = m.base
+        flat = {}
+        for delta in reversed(layers):
+            flat.update(delta)
+        return flat
+
+    # ---------------------------- Mapping interface ---------------------------- #
+
+    def get(self, key, default=None):
+        m = self
+        while m is not None:
+            value = m.delta.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            m = m.base
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        m = self
+        while m is not None:
+            if key in m.delta:
+                return True
+            m = m.base
+        return False
+
+    def __iter__(self):
+        return iter(self.to_dict())
+
+    def items(self):
+        return self.to_dict().items()
+
+    def __len__(self) -> int:
+        return len(self.to_dict())
+
+    def __eq__(self, other) -> bool:
+        if self is other:
+            return True
+        if isinstance(other, OverlayMap) and self.base is other.base:
+            # Deltas only hold entries that differ from the base, so comparing them is enough
+            return _same_entries(self.delta, other.delta)
+        if isinstance(other, Mapping):
+            # Values are compared like in `set_many`, so equality agrees with its no-op check
+            return _same_entries(self.to_dict(), other.to_dict() if isinstance(other, OverlayMap) else dict(other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"OverlayMap({self.to_dict()})"
+
+
+class TestOverlayMap(unittest.TestCase):
+    def test_updates_share_base(self):
+        base = OverlayMap({"a": 1, "b": 2})
+        m = base.set_many({"b": 3, "c": None})
+        self.assertEqual(m, {"a": 1, "b": 3, "c": None})
+        self.assertEqual(base, {"a": 1, "b": 2})
+        self.assertIs(m.base, base)
+        self.assertEqual(m.delta, {"b": 3, "c": None})
+
+    def test_noop_updates_return_same_map(self):
+        m = OverlayMap({"a": 1, "b": None})
+        self.assertIs(m.set_many({"a": 1, "b": None}), m)
+        self.assertIsNot(m.set_many({"c": None}), m)
+        self.assertIs(m.set_many({"a": True})["a"], True)
+
+    def test_equality_fast_path(self):
+        base = OverlayMap.wrap({"a": 1})
+        self.assertEqual(base.set_many({"b": 2}), base.set_many({"b": 2}))
+        self.assertNotEqual(base.set_many({"b": 2}), base.set_many({"b": 3}))
+        # Same rule as the no-op check of `set_many`
+        self.assertNotEqual(base.set_many({"b": 1}), base.set_many({"b": True}))
+        self.assertNotEqual(base.set_many({"b": 0.0}), base.set_many({"b": -0.0}))
+        self.assertNotEqual(base.set_many({"b": 1}), {"a": 1, "b": True})
+        self.assertEqual(math.copysign(1.0, OverlayMap({"a": 0.0}).set_many({"a": -0.0})["a"]), -1.0)
+        self.assertEqual(base.set_many({"a": 2}).set_many({"a": 1}), base)
+
+    def test_deep_chains_are_flattened(self):
+        m = OverlayMap()
+        n = 3 * OverlayMap.MAX_DEPTH
+        for i in range(n):
+            m = m.set_many({f"v{i % 5}": i})
+            self.assertLessEqual(m.depth, OverlayMap.MAX_DEPTH)
+        self.assertEqual(len(m), 5)
+        self.assertEqual(m[f"v{(n - 1) % 5}"], n - 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import csv
+import json
+import unittest
+from dataclasses import dataclass, field
+
+# Instrumentation for the generic dataflow solver: pass a `DataflowStats` to
+# `generic_solver.dataflow(..., stats=...)` to record how much work solving a function took,
+# e.g. to find the CFGs in a corpus that take many iterations to converge.
+
+
+@dataclass
+class DataflowStats:
+    """Counters and timings for one `dataflow` run (one function).
+    Per-block lists are indexed by node (the last one is the dummy exit node)"""
+    function: str = ""
+    # Number of nodes taken off the worklist
+    pops: int = 0
+    transfer_calls: list[int] = field(default_factory=list)
+    merge_calls: list[int] = field(default_factory=list)
+    # Number of times the output of each node changed
+    out_changes: list[int] = field(default_factory=list)
+    # Largest fact seen (number of variables, or of set bits for bit-vectors)
+    peak_fact_size: int = 0
+    # Seconds spent in the analysis' transfer and merge functions
+    transfer_time: float = 0.0
+    merge_time: float = 0.0
+
+    def reset(self, n: int) -> None:
+        self.pops = 0
+        self.transfer_calls = [0] * n
+        self.merge_calls = [0] * n
+        self.out_changes = [0] * n
+        self.peak_fact_size = 0
+        self.transfer_time = self.merge_time = 0.0
+
+    def record_fact(self, fact) -> None:
+        size = fact.bit_count() if isinstance(fact, int) else len(fact)
+        if size > self.peak_fact_size:
+            self.peak_fact_size = size
+
+    def summary(self) -> dict:
+        """Per-function totals (one CSV row)"""
+        return {
+            "function": self.function,
+            "nodes": len(self.transfer_calls),
+            "pops": self.pops,
+            "transfer_calls": sum(self.transfer_calls),
+            "merge_calls": sum(self.merge_calls),
+            "out_changes": sum(self.out_changes),
+            "max_block_transfer_calls": max(self.transfer_calls, default=0),
+            "peak_fact_size": self.peak_fact_size,
+            "transfer_time": self.transfer_time,
+            "merge_time": self.merge_time,
+        }
+
+    def to_dict(self) -> dict:
+        """Totals and per-block counters"""
+        return self.summary() | {
+            "block_transfer_calls": self.transfer_calls,
+            "block_merge_calls": self.merge_calls,
+            "block_out_changes": self.out_changes,
+        }
+
+
+STATS_FORMATS = ("json", "csv")
+
+
+def write_stats(stats: list[DataflowStats], out, fmt: str = "json") -> None:
+    """Writes the stats of several functions: a JSON list with the per-block counters,
+    or a CSV table with one row of totals per function"""
+    if fmt == "json":
+        json.dump([s.to_dict() for s in stats], out, indent=2)
+        out.write("\n")
+    elif fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=list(DataflowStats().summary()))
+        writer.writeheader()
+        for s in stats:
+            writer.writerow(s.summary())
+    else:
+        raise ValueError(f"unknown stats format '{fmt}' (choose from {', '.join(STATS_FORMATS)})")
+
+
+class TestDataflowStats(unittest.TestCase):
+    def stats(self):
+        stats = DataflowStats("main")
+        stats.reset(2)
+        stats.pops = 3
+        stats.transfer_calls = [2, 0]
+        stats.merge_calls = [2, 1]
+        stats.out_changes = [1, 1]
+        stats.record_fact({"a", "b"})
+        stats.record_fact(0b1)
+        return stats
+
+    def test_summary(self):
+        summary = self.stats().summary()
+        self.assertEqual(summary["transfer_calls"], 2)
+        self.assertEqual(summary["merge_calls"], 3)
+        self.assertEqual(summary["max_block_transfer_calls"], 2)
+        self.assertEqual(summary["peak_fact_size"], 2)
+
+    def test_formats(self):
+        import io
+
+        out = io.StringIO()
+        write_stats([self.stats()], out, "json")
+        self.assertEqual(json.loads(out.getvalue())[0]["block_merge_calls"], [2, 1])
+        out = io.StringIO()
+        write_stats([self.stats(), self.stats()], out, "csv")
+        rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]["pops"], "3")
+        with self.assertRaises(ValueError):
+            write_stats([], out, "xml")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,10 @@
-def sorted_output(output: dict|set) -> list:
+from collections.abc import Mapping
+
+
+def sorted_output(output: Mapping|set) -> list:
     if isinstance(output, set):
         return sorted(output)
-    elif isinstance(output, dict):
+    elif isinstance(output, Mapping):
         return sorted(output.items(), key=lambda item: item[0])
     else:
         raise TypeError
@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import sys
+import unittest
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from cfg import form_basic_blocks, build_cfg, get_pred_cfg
+from dominators import get_dominators, DomTree
+from dominance_frontier import get_dominance_frontier
+
+# Live variables is implemented in the L4 directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "l4"))
+
+from live_vars import live_variables
+
+# Per-function analysis manager: computes each analysis lazily, memoizes the result
+# and only recomputes the analyses that a transformation didn't preserve
+
+
+@dataclass
+class AnalysisInfo:
+    compute: Callable  # (AnalysisManager) -> result
+    depends_on: tuple[str, ...]
+
+
+ANALYSES = {
+    "cfg": AnalysisInfo(
+        compute=lambda am: build_cfg(am.basic_blocks),
+        depends_on=(),
+    ),
+    "preds": AnalysisInfo(
+        compute=lambda am: get_pred_cfg(am.get("cfg")),
+        depends_on=("cfg",),
+    ),
+    "dom_tree": AnalysisInfo(
+        compute=lambda am: DomTree(am.get("cfg")),
+        depends_on=("cfg",),
+    ),
+    "dominators": AnalysisInfo(
+        compute=lambda am: am.get("dom_tree").dom_sets(),
+        depends_on=("dom_tree",),
+    ),
+    "dominance_frontier": AnalysisInfo(
+        compute=lambda am: get_dominance_frontier(am.get("cfg"), preds=am.get("preds"), dom_tree=am.get("dom_tree")),
+        depends_on=("cfg", "preds", "dom_tree"),
+    ),
+    "live_vars": AnalysisInfo(
+        compute=lambda am: live_variables(am.basic_blocks, am.get("cfg")),
+        depends_on=("cfg",),
+    ),
+}
+
+# Analyses that only depend on the shape of the CFG, i.e. that are preserved by
+# any transformation which rewrites instructions but keeps blocks, labels and terminators
+CFG_ANALYSES = ("cfg", "preds", "dom_tree", "dominators", "dominance_frontier")
+
+
+class AnalysisManager:
+    """Lazily computes and caches analyses for the basic blocks of a single function"""
+
+    def __init__(self, basic_blocks: list[list[dict]]):
+        self.basic_blocks = basic_blocks
+        self._cache: dict[str, Any] = {}
+        # Number of times each analysis has been (re)computed
+        self.computed = Counter()
+
+    def get(self, name: str) -> Any:
+        """Returns the result of analysis `name`, computing it if it isn't cached"""
+        if name not in self._cache:
+            self._cache[name] = ANALYSES[name].compute(self)
+            self.computed[name] += 1
+        return self._cache[name]
+
+    def is_cached(self, name: str) -> bool:
+        return name in self._cache
+
+    def update(self, basic_blocks: list[list[dict]], preserves: tuple[str, ...] = ()) -> None:
+        """Records that a transformation replaced the function's basic blocks.
+        Cached analyses in `preserves` are kept (as long as everything they depend on is
+        also kept), all others are dropped and recomputed on the next `get`"""
+        self.basic_blocks = basic_blocks
+        kept = {}
+        # `ANALYSES` lists every analysis after its dependencies
+        for name in ANALYSES:
+            if name in self._cache and name in preserves and all(d in kept for d in ANALYSES[name].depends_on):
+                kept[name] = self._cache[name]
+        self._cache = kept
+
+
+# ---------------------------------------------------------------------------- #
+#                                     Tests                                    #
+# ---------------------------------------------------------------------------- #
+
+# @main { i = 0; .loop: br cond .body .done; .body: i = i + 1; jmp .loop; .done: print i; }
+def loop_blocks():
+    return [
+        [{"dest": "i", "op": "const", "type": "int", "value": 0},
+         {"dest": "one", "op": "const", "type": "int", "value": 1},
+         {"dest": "n", "op": "const", "type": "int", "value": 10}],
+        [{"label": "loop"},
+         {"args": ["i", "n"], "dest": "cond", "op": "lt", "type": "bool"},
+         {"args": ["cond"], "labels": ["body", "done"], "op": "br"}],
+        [{"label": "body"},
+         {"args": ["i", "one"], "dest": "i", "op": "add", "type": "int"},
+         {"labels": ["loop"], "op": "jmp"}],
+        [{"label": "done"},
+         {"args": ["i"], "op": "print"}],
+    ]
+
+
+class TestAnalysisManager(unittest.TestCase):
+    def test_analyses_are_memoized(self):
+        am = AnalysisManager(loop_blocks())
+        df = am.get("dominance_frontier")
+        self.assertEqual(df[2], {1})
+        self.assertEqual(am.get("dominators"), get_dominators(build_cfg(loop_blocks())))
+        am.get("preds")
+        for name in ["cfg", "preds", "dom_tree", "dominators", "dominance_frontier"]:
+            self.assertEqual(am.computed[name], 1)
+
+    def test_preserved_analyses_survive_update(self):
+        am = AnalysisManager(loop_blocks())
+        am.get("dominance_frontier")
+        live_in, _ = am.get("live_vars")
+        self.assertEqual(live_in[1], {"i", "n", "one"})
+
+        # Drop the `print i` instruction: same CFG, different liveness
+        blocks = loop_blocks()
+        blocks[3] = blocks[3][:1]
+        am.update(blocks, preserves=CFG_ANALYSES)
+        self.assertTrue(am.is_cached("dom_tree"))
+        self.assertFalse(am.is_cached("live_vars"))
+        live_in, _ = am.get("live_vars")
+        self.assertEqual(live_in[1], {"i", "n", "one"})
+        self.assertEqual(live_in[3], set())
+        self.assertEqual(am.computed["cfg"], 1)
+        self.assertEqual(am.computed["live_vars"], 2)
+
+    def test_dependents_of_invalidated_analyses_are_dropped(self):
+        am = AnalysisManager(loop_blocks())
+        am.get("dominance_frontier")
+        # Claiming to preserve the frontier without the CFG it was built from is not enough
+        am.update(loop_blocks(), preserves=("dom_tree", "dominance_frontier"))
+        self.assertFalse(am.is_cached("dom_tree"))
+        self.assertFalse(am.is_cached("dominance_frontier"))
+        am.get("dominance_frontier")
+        self.assertEqual(am.computed["cfg"], 2)
+
+
+if __name__ == "__main__":
+    # Set up an optional cmd-line argument `--test` that runs unit tests
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--test", action="store_true", help="Runs unit tests")
+    parser.add_argument("analyses", nargs="*", default=list(ANALYSES), help="Analyses to compute and print")
+    args = parser.parse_args()
+
+    if args.test:
+        unittest.main(argv=["first-arg-is-ignored"])
+    else:
+        program = json.load(sys.stdin)
+        for func in program["functions"]:
+            am = AnalysisManager(form_basic_blocks(func))
+            print(func["name"])
+            for name in args.analyses:
+                print(f"{name}: {am.get(name)}")
@@ -22,6 +22,23 @@ def get_all_paths(cfg, src, dest, path):
     return paths    
 
 
+def reachable(cfg, src, removed=None):
+    """Returns the set of nodes reachable from `src` in the `cfg` (iterative DFS, linear in its size)
+    - Paths through the node `removed` aren't followed (so it's unreachable unless it is `src`)
+    """
+    if src == removed:
+        return set()
+    seen = {src}
+    stack = [src]
+    while stack:
+        v = stack.pop()
+        for neighbor in cfg.get(v, []):
+            if neighbor not in seen and neighbor != removed:
+                seen.add(neighbor)
+                stack.append(neighbor)
+    return seen
+
+
 
 class TestGetAllPaths(unittest.TestCase):
     def test_get_all_paths_cs4120_example(self):
@@ -64,6 +81,13 @@ class TestGetAllPaths(unittest.TestCase):
             actual = get_all_paths(cfg, 0, i, [])
             self.assertListEqual(paths_to[i], actual)
 
+    def test_reachable(self):
+        cfg = cs4120_example()
+        self.assertSetEqual(reachable(cfg, 0), set(cfg.keys()))
+        # Every path to 2, 3 and 4 goes through 1
+        self.assertSetEqual(reachable(cfg, 0, removed=1), {0, 5, 6, 7, 8, 9})
+        self.assertSetEqual(reachable(cfg, 0, removed=0), set())
+
 if __name__ == "__main__":
     unittest.main()            
     
\ No newline at end of file
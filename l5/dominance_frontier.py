@@ -1,14 +1,22 @@
 # pylint: disable=redefined-outer-name
 
 import argparse
+import functools
 import json
+import os
 import unittest
 import sys
 
 from cfg import form_basic_blocks, build_cfg, get_pred_cfg, map_to_block_name
 from cfg_examples import cs4120_example, princeton_cfg
-from dominators import get_dominators
-from typing import List, Dict, Set
+from dominators import get_dominators, idoms_from_dominators, DomTree
+from typing import List, Dict, Optional, Set
+
+# Parallel per-function execution is shared with the other lessons
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+
+from parallel import add_jobs_argument, imap_functions
+from bril_io import add_format_arguments, program_reader
 
 
 # ---------------------------------------------------------------------------- #
@@ -38,49 +46,69 @@ type CFG = Dict[Idx, List[Idx]]
 # ---------------------------------------------------------------------------- #
 
 
-def dominates(doms: Dict[Idx, Set[Idx]], x: Idx, y: Idx) -> bool:
+def dominates(doms: Dict[Idx, Set[Idx]] | DomTree, x: Idx, y: Idx) -> bool:
     """`dominates(x, y)` indicates whether `x` dominates `y` in the
         dominance map `doms`.
+    - `doms` can also be a `DomTree`, which answers the query in constant time
+      without materializing the dominator sets.
     - Note: not all blocks are present as keys in `doms`, since `get_dominators`
       prunes unreachable blocks. To prevent the dict lookup operation from
       failing, we use `dict.get`, which returns an empty set if the key
       isn't in `doms`.
     """
+    if isinstance(doms, DomTree):
+        return doms.dominates(x, y)
     return x in doms.get(y, set())
 
 
-def strictly_dominates(doms: Dict[Idx, Set[Idx]], x: Idx, y: Idx) -> bool:
+def strictly_dominates(doms: Dict[Idx, Set[Idx]] | DomTree, x: Idx, y: Idx) -> bool:
     """`strictly_dominates(x, y)` indicates
     whether `x` *strictly* dominates `y` according to the dominance map `doms`"""
     result = (x != y) and dominates(doms, x, y)
     return result
 
 
-def get_dominance_frontier(cfg: CFG) -> Dict[Idx, Set[Idx]]:
-    """Computes the dominance frontier for every node in a CFG."""
+def get_dominance_frontier(
+    cfg: CFG,
+    doms: Optional[Dict[Idx, Set[Idx]]] = None,
+    preds: Optional[CFG] = None,
+    dom_tree: Optional[DomTree] = None,
+) -> Dict[Idx, Set[Idx]]:
+    """Computes the dominance frontier for every node in a CFG.
+    - Callers that have already computed the dominator tree (or the dominator map)
+      and/or the predecessor map for `cfg` can pass them in to avoid recomputing them.
+    - Uses the "runner" formulation from Cooper, Harvey & Kennedy: for every
+      predecessor `p` of a node `b`, walk up the dominator tree from `p` until
+      reaching `b`'s immediate dominator; every node on the way has `b` in its frontier.
+      This only visits (node, frontier member) pairs, instead of every pair of nodes.
+    """
 
     # Predecessors
-    preds = get_pred_cfg(cfg)
-
-    # Dominator map (maps each `v` -> set of blocks that dominate node `v`)
-    doms: Dict[Idx, Set[Idx]] = get_dominators(cfg)
-
-    # ------------------------- Some helper functions ------------------------ #
+    if preds is None:
+        preds = get_pred_cfg(cfg)
 
-    # ---------------------- Populate dominance frontier --------------------- #
+    # Immediate dominators (maps each reachable `v` -> its idom, `None` for the entry)
+    if dom_tree is not None:
+        idom = dom_tree.idom
+    elif doms is not None:
+        idom = idoms_from_dominators(doms)
+    else:
+        idom = DomTree(cfg).idom
 
     # Initialize dominance frontier
     df: Dict[Idx, Set[Idx]] = {v: set() for v in cfg}
 
     # `a`'s dominance frontier contains `b` if `a` doesn't strictly dominate `b`
     # and `a` dominates some predecessor of `b`
-    for a in cfg.keys():
-        df[a] = {
-            b
-            for b in cfg.keys()
-            if (not strictly_dominates(doms, a, b))
-            and any(dominates(doms, a, pred) for pred in preds[b])
-        }
+    for b in idom:
+        for pred in preds[b]:
+            if pred not in idom:
+                # Unreachable predecessors aren't dominated by anything
+                continue
+            runner = pred
+            while runner != idom[b]:
+                df[runner].add(b)
+                runner = idom[runner]
 
     return df
 
@@ -106,6 +134,19 @@ def df_well_formed(doms, df, preds) -> bool:
     return result
 
 
+# Dominance frontier straight from the definition, quadratic in the number of nodes
+def df_from_definition(cfg, doms, preds) -> Dict[Idx, Set[Idx]]:
+    return {
+        a: {
+            b
+            for b in cfg.keys()
+            if (not strictly_dominates(doms, a, b))
+            and any(dominates(doms, a, pred) for pred in preds[b])
+        }
+        for a in cfg.keys()
+    }
+
+
 class TestDominanceFrontier(unittest.TestCase):
     def test_dom_frontiers_cs4120_example(self):
         cfg = cs4120_example()
@@ -143,6 +184,23 @@ class TestDominanceFrontier(unittest.TestCase):
 
         self.assertTrue(df_well_formed(doms, df, preds))
 
+    def test_dom_frontiers_match_definition(self):
+        examples = [
+            cs4120_example(),
+            princeton_cfg(),
+            # Irreducible loop 1 <-> 2 with two entries
+            {0: [1, 2], 1: [2], 2: [1, 3], 3: [1, 4], 4: []},
+            # The entry is itself a loop header, 5 is unreachable
+            {0: [1], 1: [2, 3], 2: [0], 3: [4], 4: [], 5: [3]},
+        ]
+        for cfg in examples:
+            doms = get_dominators(cfg)
+            preds = get_pred_cfg(cfg)
+            expected = df_from_definition(cfg, doms, preds)
+            self.assertDictEqual(get_dominance_frontier(cfg), expected)
+            self.assertDictEqual(get_dominance_frontier(cfg, doms=doms), expected)
+            self.assertDictEqual(df_from_definition(cfg, DomTree(cfg), preds), expected)
+
 
 def post_process_df(
     df: Dict[Idx, Set[Idx]], name_map: Dict[Idx, str]
@@ -156,30 +214,39 @@ def post_process_df(
     return new_df
 
 
+def frontier_output(func: dict, check: bool = False) -> str:
+    """The printed dominance frontiers of a function (block labels -> the labels in their frontier)"""
+    bbs: List[Block] = form_basic_blocks(func)
+    name_map = map_to_block_name(bbs)
+    cfg = build_cfg(bbs)
+    preds = get_pred_cfg(cfg)
+    dom_tree = DomTree(cfg)
+
+    # Compute dominance frontiers
+    df = get_dominance_frontier(cfg, preds=preds, dom_tree=dom_tree)
+
+    # Check that the DF we computed is well-formed
+    if check:
+        assert df_well_formed(dom_tree, df, preds)
+
+    # Replace block indices in the DF with block labels
+    final_df = post_process_df(df, name_map)
+    return f"{func['name']}\n{json.dumps(final_df, indent=2, sort_keys=True)}"
+
+
 if __name__ == "__main__":
     # Set up an optional cmd-line argument `--test` that runs unit tests
     parser = argparse.ArgumentParser()
     parser.add_argument("--test", action="store_true", help="Runs unit tests")
+    parser.add_argument("--check", action="store_true", help="Checks (slowly) that each frontier is well-formed")
+    add_jobs_argument(parser)
+    add_format_arguments(parser, output=False)
     args = parser.parse_args()
 
     if args.test:
         unittest.main(argv=["first-arg-is-ignored"])
     else:
-        program = json.load(sys.stdin)
-        for func in program["functions"]:
-            bbs: List[Block] = form_basic_blocks(func)
-            name_map = map_to_block_name(bbs)
-            cfg = build_cfg(bbs)
-            preds = get_pred_cfg(cfg)
-            doms = get_dominators(cfg)
-
-            # Compute dominance frontiers
-            df = get_dominance_frontier(cfg)
-
-            # Check that the DF we computed is well-formed
-            assert df_well_formed(doms, df, preds)
-
-            # Replace block indices in the DF with block labels
-            final_df = post_process_df(df, name_map)
-            print(func["name"])
-            print(json.dumps(final_df, indent=2, sort_keys=True))
+        functions = program_reader(sys.stdin, args.in_format).functions()
+        outputs = imap_functions(functools.partial(frontier_output, check=args.check), functions, args.jobs)
+        for output in outputs:
+            print(output)
@@ -1,51 +1,151 @@
 import json
+import os
 import sys
 import argparse
-from graphviz import Digraph
+import tempfile
+import unittest
 
 from cfg import form_basic_blocks, build_cfg, add_entry_block, map_to_block_name
-from dominators import get_dominators
+from cfg_examples import cs4120_example, princeton_cfg
+from dominators import get_dominators, idoms_from_dominators, DomTree
 
 # Implemention for constructing a dominance tree for a given CFG
 
-def get_dominance_tree(doms: dict[int,set[int]], cfg: dict[int,list[int]]) -> dict[int, list[int]]:
-    """Computes the dominance tree for a given CFG. 
+def get_dominance_tree(doms: dict[int, set[int]] | DomTree, cfg: dict[int, list[int]], exit_node: int | None = None) -> dict[int, list[int]]:
+    """Computes the dominance tree for a given CFG.
     For this tree, each node's children are those nodes it immediately dominates.
-    Returns a mapping of vertex -> its successors in the dominance tree."""
-    dom_tree = dict()
-    reverse_doms = {v: {k for k, s in doms.items() if v in s} for v in set.union(*doms.values())}
-    for vertex in reverse_doms:
-        # get the immediate successors of this node
-        # but don't include the very last block, the one after the exit block
-        dom_tree[vertex] = [item for item in (reverse_doms[vertex] & set(cfg[vertex])) if item != len(reverse_doms) - 1]
+    Returns a mapping of vertex -> its successors in the dominance tree.
+    - `doms` is either a `DomTree` or the dominator map returned by `get_dominators`.
+      The tree is read off the immediate dominators, so this is linear in the number of nodes.
+    - `exit_node` is the dummy exit node added by `build_cfg` (by default the last node of `cfg`),
+      it's kept as a key but isn't attached to its immediate dominator."""
+    if exit_node is None:
+        exit_node = len(cfg) - 1
+    idom = doms.idom if isinstance(doms, DomTree) else idoms_from_dominators(doms)
+    dom_tree = {vertex: [] for vertex in sorted(idom)}
+    for vertex, parent in dom_tree_edges(idom):
+        if vertex != exit_node:
+            dom_tree[parent].append(vertex)
     return dom_tree
 
 
+def dom_tree_edges(idom: dict[int, int | None]):
+    """Yields the (child, parent) edges of the dominator tree, in ascending child order"""
+    for vertex in sorted(idom):
+        parent = idom[vertex]
+        if parent is not None:
+            yield vertex, parent
+
+
+# ---------------------------------------------------------------------------- #
+#                              Streaming emitters                              #
+# ---------------------------------------------------------------------------- #
+# Both emitters yield the output piece by piece, so a dominance tree can be
+# written out without building the whole graph (or string) in memory first
+
+def _quote(name: str) -> str:
+    return json.dumps(name)
+
+
+def iter_dot(dom_tree: dict[int, list[int]], names: dict[int, str], graph_name: str = "dominance_tree"):
+    """Yields the lines of a Graphviz DOT digraph for the dominance tree"""
+    yield f"digraph {_quote(graph_name)} {{"
+    for node in dom_tree:
+        yield f"  {node} [label={_quote(names[node])}];"
+    for parent, children in dom_tree.items():
+        for child in children:
+            yield f"  {parent} -> {child};"
+    yield "}"
+
+
+def iter_json(dom_tree: dict[int, list[int]], names: dict[int, str]):
+    """Yields the pieces of a (single-line) JSON object mapping each block name -> the names of its children"""
+    yield "{"
+    for i, (parent, children) in enumerate(dom_tree.items()):
+        yield f"{', ' if i else ''}{_quote(names[parent])}: {json.dumps([names[c] for c in children])}"
+    yield "}"
+
+
+def write_lines(lines, out) -> None:
+    for line in lines:
+        out.write(line)
+        out.write("\n")
+
+
+def draw(dom_tree: dict[int, list[int]], names: dict[int, str], filename: str = "dominance_tree") -> None:
+    """Renders the dominance tree to `{filename}.png` with the Graphviz `dot` tool and displays it.
+    The DOT source is streamed to a temporary file and rendered from there"""
+    import graphviz
+
+    with tempfile.NamedTemporaryFile("w", suffix=".gv", delete=False) as f:
+        write_lines(iter_dot(dom_tree, names), f)
+    try:
+        graphviz.render("dot", "png", f.name, outfile=f"{filename}.png")
+    finally:
+        os.remove(f.name)
+    graphviz.view(f"{filename}.png")
+
+
+class TestDominanceTree(unittest.TestCase):
+    def test_princeton_example(self):
+        cfg = princeton_cfg()
+        expected = {0: [1], 1: [2], 2: [3, 4, 6], 3: [5], 4: [], 5: [], 6: [7], 7: [8], 8: []}
+        self.assertDictEqual(get_dominance_tree(DomTree(cfg), cfg, exit_node=-1), expected)
+        self.assertDictEqual(get_dominance_tree(get_dominators(cfg), cfg, exit_node=-1), expected)
+
+    def test_non_cfg_edges(self):
+        # 1 and 2 both jump to 3, whose immediate dominator 0 isn't one of its predecessors
+        cfg = {0: [1, 2], 1: [3], 2: [3], 3: [4], 4: []}
+        self.assertDictEqual(get_dominance_tree(DomTree(cfg), cfg), {0: [1, 2, 3], 1: [], 2: [], 3: [], 4: []})
+
+    def test_unreachable_blocks(self):
+        # 3 is unreachable, the exit node is still 4
+        cfg = {0: [1, 2], 1: [4], 2: [4], 3: [2], 4: []}
+        self.assertDictEqual(get_dominance_tree(DomTree(cfg), cfg), {0: [1, 2], 1: [], 2: [], 4: []})
+
+    def test_emitters(self):
+        cfg = cs4120_example()
+        dom_tree = get_dominance_tree(DomTree(cfg), cfg, exit_node=-1)
+        names = {v: f"b{v}" for v in cfg}
+        parsed = json.loads("".join(iter_json(dom_tree, names)))
+        self.assertEqual(parsed, {names[p]: [names[c] for c in cs] for p, cs in dom_tree.items()})
+        dot = list(iter_dot(dom_tree, names))
+        self.assertEqual(sum("->" in line for line in dot), len(cfg) - 1)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
+    parser.add_argument('--test', action='store_true', help="Runs unit tests")
     parser.add_argument('--draw', action='store_true', help="Draw and display the dominance tree graph.")
+    parser.add_argument('--emit', choices=['dot', 'json'], help="Stream the dominance tree to stdout in this format instead of printing the mapping")
     args = parser.parse_args()
-    
+
+    if args.test:
+        unittest.main(argv=["first-arg-is-ignored"])
+        sys.exit()
+
     program = json.load(sys.stdin)
     for func in program["functions"]:
         basic_blocks = form_basic_blocks(func)
         basic_blocks = add_entry_block(basic_blocks)
         cfg = build_cfg(basic_blocks)
-        print(func["name"])
-        doms = get_dominators(cfg)
-        dom_tree = get_dominance_tree(doms, cfg)
-        print(dom_tree)
-        
-        if args.draw:
+        dom_tree = get_dominance_tree(DomTree(cfg), cfg)
+        if not args.emit:
+            print(func["name"])
+            print(dom_tree)
+
+        if args.emit or args.draw:
             names_map = map_to_block_name(basic_blocks)
-            dot = Digraph()
-            for node, name in list(names_map.items())[:-1]: # don't include the very last block after exit in the graph
-                dot.node(str(node), label=name)
+            # don't include the very last block after exit in the graph
+            dom_tree.pop(len(basic_blocks), None)
 
-            for parent, children in dom_tree.items():
-                for child in children:
-                    dot.edge(str(parent), str(child))
+        if args.emit == 'dot':
+            write_lines(iter_dot(dom_tree, names_map, graph_name=func["name"]), sys.stdout)
+        elif args.emit == 'json':
+            # One JSON object per line (function)
+            sys.stdout.write(f'{{"function": {json.dumps(func["name"])}, "tree": ')
+            sys.stdout.writelines(iter_json(dom_tree, names_map))
+            sys.stdout.write("}\n")
 
-            # Render the graph to a file and display
-            dot.render('dominance_tree', format='png', cleanup=True)
-            dot.view()
+        if args.draw:
+            draw(dom_tree, names_map)
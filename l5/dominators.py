@@ -1,22 +1,283 @@
+import argparse
 import json
+import os
 import sys
+import unittest
 
-from cfg import form_basic_blocks, build_cfg, get_pred_cfg, add_entry_block
-from dfs import get_all_paths
+from cfg import form_basic_blocks, build_cfg, add_entry_block
+from cfg_examples import cs4120_example, princeton_cfg
+from dfs import reachable
 
+# The array-backed CFG representation is shared with L4/L6
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
 
-def get_dominators(cfg: dict[int, list[int]]) -> dict[int, set[int]]:
-    """Computes dominators for a CFG and returns a mapping of block -> list of blocks that dominate that block"""
-    clean_cfg = cfg.copy()
-    _prune_unreachable_blocks(clean_cfg)
-    dom = {k: set(clean_cfg.keys()) for k in clean_cfg}
+from csr_cfg import CSRCFG
+
+
+class DomTree:
+    """Dominator tree of the nodes reachable from `entry`. Immediate dominators are computed with
+    - `method="chk"`: the Cooper-Harvey-Kennedy algorithm ("A Simple, Fast Dominance Algorithm"):
+      immediate dominators are refined in reverse postorder, intersecting two
+      candidates by walking up the current idom tree by postorder number.
+    - `method="lt"`: the Lengauer-Tarjan algorithm (semidominators + path compression),
+      which doesn't iterate, so it scales better on very large or deeply nested CFGs.
+
+    - `idom` maps every reachable node to its immediate dominator (`None` for the entry)
+    - `children` maps every reachable node to the nodes it immediately dominates
+    - `dominators(v)` returns the set of nodes dominating `v`, built lazily from `idom`
+    - `dominates(x, y)` / `strictly_dominates(x, y)` answer ancestor queries in O(1),
+      using the DFS entry/exit numbers of the nodes in the dominator tree
+    """
+
+    def __init__(self, cfg: dict[int, list[int]] | CSRCFG, entry: int = 0, method: str = "chk"):
+        graph = CSRCFG.from_dict(cfg)
+        self.entry = entry
+        self.postorder = graph.postorder(entry)
+        self.rpo = self.postorder[::-1]
+        if method == "chk":
+            self.idom = _chk_idoms(graph, entry, self.postorder)
+        elif method == "lt":
+            self.idom = _lt_idoms(graph, entry)
+        else:
+            raise ValueError(f"unknown dominator method '{method}'")
+        self.n = graph.n
+        self._dom_sets: dict[int, set[int]] = {}
+        self._children = None
+        self._pre = None
+        self._last = None
+
+    def __repr__(self) -> str:
+        return f"DomTree(idom={self.idom})"
+
+    @property
+    def children(self) -> dict[int, list[int]]:
+        if self._children is None:
+            self._children = {v: [] for v in sorted(self.idom)}
+            for v in self._children:
+                parent = self.idom[v]
+                if parent is not None:
+                    self._children[parent].append(v)
+        return self._children
+
+    def dominators(self, v: int) -> set[int]:
+        """The set of nodes that dominate `v` (including `v` itself)"""
+        doms = self._dom_sets.get(v)
+        if doms is None:
+            # Walk up to the closest ancestor whose set is already known
+            chain = []
+            while v is not None and v not in self._dom_sets:
+                chain.append(v)
+                v = self.idom[v]
+            doms = self._dom_sets[v] if v is not None else set()
+            for u in reversed(chain):
+                doms = {u}.union(doms)
+                self._dom_sets[u] = doms
+        return doms
+
+    def dom_sets(self) -> dict[int, set[int]]:
+        """Mapping of every reachable block -> set of blocks that dominate it"""
+        return {v: self.dominators(v) for v in sorted(self.idom)}
+
+    def _number(self) -> None:
+        """Numbers the dominator tree in DFS preorder: `pre[v]` is v's entry number and
+        `last[v]` the largest entry number in v's subtree (i.e. v's exit number),
+        so x dominates y iff `pre[x] <= pre[y] <= last[x]`.
+        Unreachable nodes get `pre = -1, last = -2`, so they never dominate or are dominated"""
+        pre = [-1] * self.n
+        last = [-2] * self.n
+        children = self.children
+        counter = 0
+        pre[self.entry] = counter
+        stack = [(self.entry, iter(children[self.entry]))]
+        while stack:
+            v, it = stack[-1]
+            child = next(it, None)
+            if child is None:
+                stack.pop()
+                last[v] = counter
+            else:
+                counter += 1
+                pre[child] = counter
+                stack.append((child, iter(children[child])))
+        self._pre, self._last = pre, last
+
+    def dominates(self, x: int, y: int) -> bool:
+        """Whether `x` dominates `y` (every node dominates itself)"""
+        if self._pre is None:
+            self._number()
+        pre = self._pre
+        return pre[x] <= pre[y] <= self._last[x]
+
+    def strictly_dominates(self, x: int, y: int) -> bool:
+        """Whether `x` dominates `y` and `x != y`"""
+        return x != y and self.dominates(x, y)
+
+    def dominates_all(self, pairs) -> list[bool]:
+        """Batch version of `dominates`: one result per `(x, y)` pair"""
+        if self._pre is None:
+            self._number()
+        pre, last = self._pre, self._last
+        return [pre[x] <= pre[y] <= last[x] for x, y in pairs]
+
+
+def _chk_idoms(graph: CSRCFG, entry: int, postorder: list[int]) -> dict[int, int | None]:
+    po_num = [-1] * graph.n
+    for i, v in enumerate(postorder):
+        po_num[v] = i
+    idom = [-1] * graph.n
+    idom[entry] = entry
+    pred_offsets, pred_targets = graph.pred_offsets, graph.pred_targets
+
+    rpo = postorder[::-1]
+    changed = True
+    while changed:
+        changed = False
+        for b in rpo:
+            if b == entry:
+                continue
+            new_idom = -1
+            for i in range(pred_offsets[b], pred_offsets[b + 1]):
+                p = pred_targets[i]
+                if idom[p] == -1:
+                    # Unreachable or not processed yet
+                    continue
+                if new_idom == -1:
+                    new_idom = p
+                    continue
+                # Intersect: walk both fingers up the idom tree until they meet
+                f1, f2 = p, new_idom
+                while f1 != f2:
+                    while po_num[f1] < po_num[f2]:
+                        f1 = idom[f1]
+                    while po_num[f2] < po_num[f1]:
+                        f2 = idom[f2]
+                new_idom = f1
+            if idom[b] != new_idom:
+                idom[b] = new_idom
+                changed = True
+
+    return {v: (idom[v] if v != entry else None) for v in rpo}
+
+
+def _lt_idoms(graph: CSRCFG, entry: int) -> dict[int, int | None]:
+    offsets, targets = graph.succ_offsets, graph.succ_targets
+    pred_offsets, pred_targets = graph.pred_offsets, graph.pred_targets
+
+    # DFS preorder numbering: `vertex[i]` is the i-th node visited, `semi[v]` starts as v's number
+    semi = [-1] * graph.n
+    parent = [-1] * graph.n
+    vertex = [entry]
+    semi[entry] = 0
+    stack = [(entry, offsets[entry])]
+    while stack:
+        v, i = stack[-1]
+        if i < offsets[v + 1]:
+            stack[-1] = (v, i + 1)
+            s = targets[i]
+            if semi[s] == -1:
+                semi[s] = len(vertex)
+                vertex.append(s)
+                parent[s] = v
+                stack.append((s, offsets[s]))
+        else:
+            stack.pop()
+
+    # Forest built while processing nodes in reverse preorder; `label[v]` is the node with
+    # the smallest semidominator on the (compressed) path from v up to its forest root
+    ancestor = [-1] * graph.n
+    label = list(range(graph.n))
+
+    def _eval(v: int) -> int:
+        if ancestor[v] == -1:
+            return v
+        # Path compression, iteratively: update the nodes closest to the root first
+        path = []
+        u = v
+        while ancestor[ancestor[u]] != -1:
+            path.append(u)
+            u = ancestor[u]
+        while path:
+            u = path.pop()
+            a = ancestor[u]
+            if semi[label[a]] < semi[label[u]]:
+                label[u] = label[a]
+            ancestor[u] = ancestor[a]
+        return label[v]
+
+    idom = [-1] * graph.n
+    bucket: dict[int, list[int]] = {}
+    for i in range(len(vertex) - 1, 0, -1):
+        w = vertex[i]
+        # Semidominator of w: smallest semi over (evaluated) predecessors
+        for j in range(pred_offsets[w], pred_offsets[w + 1]):
+            v = pred_targets[j]
+            if semi[v] == -1:
+                # Unreachable predecessor
+                continue
+            u = _eval(v)
+            if semi[u] < semi[w]:
+                semi[w] = semi[u]
+        bucket.setdefault(vertex[semi[w]], []).append(w)
+        p = parent[w]
+        ancestor[w] = p
+        # Implicitly define the immediate dominators of the nodes whose semidominator is p
+        for v in bucket.pop(p, []):
+            u = _eval(v)
+            idom[v] = u if semi[u] < semi[v] else p
+
+    # Explicitly define the immediate dominators, in preorder
+    for w in vertex[1:]:
+        if idom[w] != vertex[semi[w]]:
+            idom[w] = idom[idom[w]]
+
+    return {v: (idom[v] if v != entry else None) for v in vertex}
+
+
+def get_dominators(cfg: dict[int, list[int]] | CSRCFG, method: str = "chk") -> dict[int, set[int]]:
+    """Computes dominators for a CFG and returns a mapping of block -> list of blocks that dominate that block
+    - `method="chk"` (default) or `method="lt"` derive them from the immediate dominators in `DomTree`
+    - `method="iterative"` is the original set-intersection fixpoint
+    """
+    if method == "iterative":
+        return _iterative_dominators(cfg)
+    return DomTree(cfg, method=method).dom_sets()
+
+
+def idoms_from_dominators(doms: dict[int, set[int]]) -> dict[int, int | None]:
+    """Recovers immediate dominators from a dominator map: the immediate dominator of `v`
+    is the strict dominator of `v` that is itself dominated by all the others"""
+    idom: dict[int, int | None] = {}
+    for v, vs in doms.items():
+        strict = [d for d in vs if d != v]
+        idom[v] = max(strict, key=lambda d: len(doms[d])) if strict else None
+    return idom
+
+
+def verify_dominators(cfg: dict[int, list[int]] | CSRCFG, doms: dict[int, set[int]], entry: int = 0) -> bool:
+    """Independently checks a dominator map: `d` strictly dominates `v` iff `v` is reachable
+    from the entry but becomes unreachable once `d` is removed from the CFG.
+    One DFS per reachable node, i.e. O(n * e)"""
+    nodes = reachable(cfg, entry)
+    if set(doms) != nodes:
+        return False
+    expected = {v: {v} for v in nodes}
+    for d in nodes:
+        for v in nodes - reachable(cfg, entry, removed=d):
+            expected[v].add(d)
+    return all(set(doms[v]) == expected[v] for v in nodes)
+
+
+def _iterative_dominators(cfg: dict[int, list[int]] | CSRCFG) -> dict[int, set[int]]:
+    graph = CSRCFG.from_dict(cfg)
+    vertices = _prune_unreachable_blocks(graph)
+    dom = {k: set(vertices) for k in vertices}
     dom[0] = {0}
-    pred_cfg = get_pred_cfg(clean_cfg)
+    pred_cfg = {v: [p for p in graph.predecessors(v) if p in dom] for v in vertices}
 
     changing = True
     while changing:
         changing = False
-        for vertex in clean_cfg:
+        for vertex in vertices:
             initial_doms = dom[vertex]
             if vertex == 0:
                 continue
@@ -31,33 +292,88 @@ def get_dominators(cfg: dict[int, list[int]]) -> dict[int, set[int]]:
     return dom
 
 
-def _prune_unreachable_blocks(cfg:dict[int, list[int]]) -> None:
-    # Remove unreachable blocks
+def _prune_unreachable_blocks(graph: CSRCFG) -> list[int]:
+    # Remove unreachable blocks (returns the remaining vertices)
     # e.g. https://cs6120.zulipchat.com/#narrow/channel/254729-general/topic/is-decreasing.2Ebril.20dominance.20frontier
-    unreachable = []
-    pred_cfg = get_pred_cfg(cfg)
-    for b in pred_cfg:
-        if b != 0 and not pred_cfg[b]:
-            unreachable.append(b)
-    for b in unreachable:
-        del cfg[b]
+    offsets = graph.pred_offsets
+    return [b for b in range(graph.n) if b == 0 or offsets[b] != offsets[b + 1]]
+
+
+class TestDominators(unittest.TestCase):
+    def test_dominance_queries_match_sets(self):
+        # The last example has an unreachable node 5
+        examples = [cs4120_example(), princeton_cfg(), {0: [1], 1: [2, 3], 2: [0], 3: [4], 4: [], 5: [3]}]
+        for cfg in examples:
+            tree = DomTree(cfg)
+            doms = get_dominators(cfg, method="iterative")
+            pairs = [(x, y) for x in cfg for y in cfg]
+            expected = [x in doms.get(y, set()) for x, y in pairs]
+            self.assertEqual([tree.dominates(x, y) for x, y in pairs], expected)
+            self.assertEqual(tree.dominates_all(pairs), expected)
+            self.assertEqual(
+                [tree.strictly_dominates(x, y) for x, y in pairs],
+                [d and x != y for d, (x, y) in zip(expected, pairs)],
+            )
+
+    def test_idoms_princeton_example(self):
+        tree = DomTree(princeton_cfg())
+        self.assertDictEqual(tree.idom, {0: None, 1: 0, 2: 1, 3: 2, 4: 2, 5: 3, 6: 2, 7: 6, 8: 7})
+        self.assertDictEqual(
+            tree.children, {0: [1], 1: [2], 2: [3, 4, 6], 3: [5], 4: [], 5: [], 6: [7], 7: [8], 8: []}
+        )
+        self.assertSetEqual(tree.dominators(5), {0, 1, 2, 3, 5})
+
+    def test_idoms_cs4120_example(self):
+        tree = DomTree(cs4120_example())
+        self.assertDictEqual(tree.idom, {0: None, 1: 0, 2: 1, 3: 1, 4: 1, 5: 0, 6: 0, 7: 0, 8: 0, 9: 0})
+
+    def test_lengauer_tarjan_idoms(self):
+        for cfg in [cs4120_example(), princeton_cfg()]:
+            self.assertDictEqual(DomTree(cfg, method="lt").idom, DomTree(cfg).idom)
+
+    def test_methods_agree(self):
+        for cfg in [cs4120_example(), princeton_cfg()]:
+            expected = get_dominators(cfg, method="iterative")
+            self.assertDictEqual(get_dominators(cfg), expected)
+            self.assertDictEqual(get_dominators(cfg, method="lt"), expected)
+
+    def test_verify_dominators(self):
+        for cfg in [cs4120_example(), princeton_cfg(), {0: [1], 1: [2, 3], 2: [0], 3: [4], 4: [], 5: [3]}]:
+            doms = get_dominators(cfg)
+            self.assertTrue(verify_dominators(cfg, doms))
+        # 4 doesn't dominate 7 in the Princeton example
+        doms = get_dominators(princeton_cfg())
+        doms[7] = doms[7] | {4}
+        self.assertFalse(verify_dominators(princeton_cfg(), doms))
+
+    def test_methods_agree_irreducible(self):
+        # 0 -> {1, 2}, 1 <-> 2 (a loop with two entries), 2 -> 3 -> {1, 4}
+        cfg = {0: [1, 2], 1: [2], 2: [1, 3], 3: [1, 4], 4: []}
+        expected = get_dominators(cfg, method="iterative")
+        self.assertDictEqual(get_dominators(cfg), expected)
+        self.assertDictEqual(get_dominators(cfg, method="lt"), expected)
 
 
 if __name__ == "__main__":
-    program = json.load(sys.stdin)
-    for func in program["functions"]:
-        bbs = form_basic_blocks(func)
-        bbs = add_entry_block(bbs)
-        c = build_cfg(bbs)
-        pc = get_pred_cfg(c)
-        print(func["name"])
-        doms = get_dominators(c)
-        print(doms)
-        
-        # Use DFS to find all paths from entry and compare to dominators
-        for k,v in doms.items():
-            paths = get_all_paths(c, 0, k, [])
-            dfs_doms = set(paths[0])
-            for p in paths[1:]:
-                dfs_doms = dfs_doms.intersection(p)
-            assert set(v) == dfs_doms
\ No newline at end of file
+    # Set up an optional cmd-line argument `--test` that runs unit tests
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--test", action="store_true", help="Runs unit tests")
+    parser.add_argument("--method", choices=["chk", "lt", "iterative"], default="chk", help="Dominator algorithm")
+    parser.add_argument("--verify", action="store_true", help="Checks the dominators by testing reachability with each node removed")
+    args = parser.parse_args()
+
+    if args.test:
+        unittest.main(argv=["first-arg-is-ignored"])
+    else:
+        program = json.load(sys.stdin)
+        for func in program["functions"]:
+            bbs = form_basic_blocks(func)
+            bbs = add_entry_block(bbs)
+            c = build_cfg(bbs)
+            print(func["name"])
+            doms = get_dominators(c, method=args.method)
+            print(doms)
+
+            # Check the dominators against the definition (remove each node, then test reachability)
+            if args.verify:
+                assert verify_dominators(c, doms)
@@ -1,8 +1,14 @@
-import json
+import argparse
+import os
 import sys
 
 from cfg import form_basic_blocks
 
+# Program I/O is shared with the other lessons
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+
+from bril_io import add_format_arguments, stream_program
+
 
 def _get_var_types(blocks: list[list[dict]]) -> dict[str, str]:
     """Takes a list of basic blocks, and for every 'get' instruction, obtains the dest variable's type
@@ -37,12 +43,16 @@ def from_ssa(blocks: list[list[dict]]) -> list[list[dict]]:
     return from_ssa_blocks
 
 
+def from_ssa_function(func: dict) -> list[dict]:
+    """The instructions of `func` converted out of SSA form"""
+    instrs = []
+    for blocks in from_ssa(form_basic_blocks(func)):
+        instrs.extend(blocks)
+    return instrs
+
+
 if __name__ == "__main__":
-    program = json.load(sys.stdin)
-    for func in program["functions"]:
-        basic_blocks = form_basic_blocks(func)
-        from_ssa_blocks = from_ssa(basic_blocks)
-        func["instrs"] = []
-        for blocks in from_ssa_blocks:
-            func["instrs"].extend(blocks)
-    json.dump(program, sys.stdout, indent=2)
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    add_format_arguments(parser)
+    args = parser.parse_args()
+    stream_program(from_ssa_function, args)
\ No newline at end of file
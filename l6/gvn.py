@@ -0,0 +1,243 @@
+import argparse
+import os
+import sys
+import unittest
+from collections import Counter
+
+from cfg import form_basic_blocks, build_cfg
+
+# Value numbering and folding come from LVN (L3), dominator trees from L5, program I/O from common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "l3"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "l5"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+
+from lvn import COMMUTATIVE, canonicalize, const_value
+from fold import CONST, fold, simplify
+from dominators import DomTree
+from bril_io import add_format_arguments, stream_program
+from bril_ir import HAS_DEST, IS_PURE, PURE, Instr, Opcode, VarTable
+from parallel import add_jobs_argument
+
+# Dominator-based global value numbering: extends LVN across basic blocks by walking the dominator
+# tree with a scoped value table. A value computed in a block is available in every block it dominates,
+# so it is entered in the table while the block's subtree is visited and removed afterwards.
+#
+# A variable that is assigned only once in the function (every variable in SSA form) holds the same
+# value everywhere its definition dominates, so it can stand for its value in the table. Variables
+# assigned more than once (e.g. the shadow variables left by `from_ssa`) are treated as unknown:
+# the pass is meant to run on SSA form, but is safe on any program.
+#
+# Redundant instructions are replaced by an `id` of the variable holding the value, and later uses
+# are renamed to that variable, so the copies are left for TDCE to remove, e.g. `to_ssa | gvn | from_ssa | tdce`.
+
+# Pure operations that are numbered (`id` is handled as a copy, `phi` and `undef` aren't values)
+_NUMBERED = PURE - {Opcode.ID, Opcode.PHI, Opcode.UNDEF}
+
+
+class ScopedTable:
+    """Dictionaries whose entries are undone when the scope they were added in is exited"""
+
+    def __init__(self):
+        self.leader: dict[int, int] = {}  # Variable -> variable defined earlier that holds the same value
+        self.consts: dict[int, object] = {}  # Variable -> its constant value
+        self.values: dict[tuple, int] = {}  # Value -> variable holding it
+        self.log: list[tuple[dict, object]] = []
+
+    def set(self, table: dict, key, value) -> None:
+        table[key] = value
+        self.log.append((table, key))
+
+    def enter(self) -> int:
+        return len(self.log)
+
+    def exit(self, mark: int) -> None:
+        while len(self.log) > mark:
+            table, key = self.log.pop()
+            del table[key]
+
+
+def _number_block(block: list[Instr], scope: ScopedTable, single_def) -> list[Instr]:
+    """Rewrites a block with the values available from its dominators, adding its own values to `scope`"""
+    new_block = []
+    for instr in block:
+        args = instr.args
+        if args is not None:
+            args = tuple(scope.leader.get(a, a) for a in args)
+        if not instr.flags & HAS_DEST or not instr.flags & IS_PURE or not all(single_def(a) for a in args or ()):
+            # Not a value, or one that depends on variables whose value can change
+            new_block.append(instr if args == instr.args else instr.replace(args=args))
+            continue
+
+        dest = instr.dest
+        if instr.op != Opcode.CONST and args:
+            consts = [scope.consts.get(a) for a in args]
+            simplified = None
+            if None not in consts:
+                constant = fold(instr.op, consts)
+                if constant is not None:
+                    simplified = (CONST, constant)
+            if simplified is None:
+                simplified = simplify(instr.op, args, consts)
+            if simplified is not None:
+                kind, x = simplified
+                if kind == CONST:
+                    instr = instr.replace(op=Opcode.CONST, args=None, value=x)
+                else:
+                    instr = instr.replace(op=Opcode.ID, args=(args[x],))
+                args = instr.args
+
+        op = instr.op
+        if op == Opcode.ID:
+            # Copy: later uses of `dest` are renamed to its argument
+            source = args[0]
+            if single_def(dest):
+                scope.set(scope.leader, dest, source)
+                if source in scope.consts:
+                    scope.set(scope.consts, dest, scope.consts[source])
+            new_block.append(instr if args == instr.args else instr.replace(args=args))
+            continue
+
+        if op == Opcode.CONST:
+            value = const_value(instr)
+        elif op in _NUMBERED:
+            value = (instr.opname, *args)
+            if op in COMMUTATIVE:
+                value = canonicalize(value)
+        else:
+            new_block.append(instr if args == instr.args else instr.replace(args=args))
+            continue
+
+        if value in scope.values:
+            # Computed in this block or a dominating one
+            source = scope.values[value]
+            new_block.append(Instr(Opcode.ID, dest=dest, type=instr.type, args=(source,)))
+            if single_def(dest):
+                scope.set(scope.leader, dest, source)
+                if source in scope.consts:
+                    scope.set(scope.consts, dest, scope.consts[source])
+            continue
+
+        if single_def(dest):
+            scope.set(scope.values, value, dest)
+            if op == Opcode.CONST:
+                scope.set(scope.consts, dest, instr.value)
+        new_block.append(instr if args == instr.args else instr.replace(args=args))
+    return new_block
+
+
+def gvn(blocks: list[list[Instr]], dom_tree: DomTree, func_args: tuple[int, ...] = ()) -> list[list[Instr]]:
+    """Global value numbering of a function's basic blocks, in the order of a preorder walk of `dom_tree`.
+    Blocks that aren't reachable from the entry are left as they are"""
+    defs = Counter(instr.dest for block in blocks for instr in block if instr.flags & HAS_DEST)
+    defs.update(func_args)
+    single_def = lambda v: defs[v] == 1
+
+    new_blocks = list(blocks)
+    children = dom_tree.children
+    scope = ScopedTable()
+    # (block, scope mark): the mark is None when entering the block, and the scope to restore when leaving it
+    stack = [(dom_tree.entry, None)]
+    while stack:
+        node, mark = stack.pop()
+        if mark is not None:
+            scope.exit(mark)
+            continue
+        stack.append((node, scope.enter()))
+        if node < len(blocks):
+            new_blocks[node] = _number_block(blocks[node], scope, single_def)
+        stack.extend((child, None) for child in reversed(children[node]))
+    return new_blocks
+
+
+def gvn_blocks(bbs: list[list[dict]], dom_tree: DomTree | None = None, func_args: list[dict] = ()) -> list[list[dict]]:
+    """Runs GVN on the basic blocks of a function and returns the rewritten blocks.
+    `dom_tree` is the dominator tree of `build_cfg(bbs)` (computed if it isn't given)"""
+    if dom_tree is None:
+        dom_tree = DomTree(build_cfg(bbs))
+    variables = VarTable()
+    arg_ids = tuple(variables.id(arg["name"]) for arg in func_args)
+    blocks = [[Instr.from_json(instr, variables, keep_source=True) for instr in bb] for bb in bbs]
+    return [[instr.to_json(variables) for instr in bb] for bb in gvn(blocks, dom_tree, arg_ids)]
+
+
+def gvn_function(func: dict) -> list[dict]:
+    """The instructions of `func` after global value numbering"""
+    instrs = []
+    for bb in gvn_blocks(form_basic_blocks(func), func_args=func.get("args", [])):
+        instrs.extend(bb)
+    return instrs
+
+
+class TestGVN(unittest.TestCase):
+    def run_gvn(self, instrs: list[dict]) -> list[dict]:
+        return gvn_function({"name": "main", "args": [{"name": "a", "type": "int"}, {"name": "b", "type": "int"},
+                                                      {"name": "c", "type": "bool"}],
+                             "instrs": instrs})
+
+    def test_dominating_value_is_reused(self):
+        instrs = [
+            {"args": ["a", "b"], "dest": "x", "op": "add", "type": "int"},
+            {"label": "loop"},
+            {"args": ["b", "a"], "dest": "y", "op": "add", "type": "int"},
+            {"args": ["y"], "op": "print"},
+            {"args": ["c"], "labels": ["loop", "done"], "op": "br"},
+            {"label": "done"},
+        ]
+        out = self.run_gvn(instrs)
+        self.assertEqual(out[2], {"args": ["x"], "dest": "y", "op": "id", "type": "int"})
+        self.assertEqual(out[3], {"args": ["x"], "op": "print"})
+
+    def test_sibling_values_are_not_reused(self):
+        instrs = [
+            {"args": ["c"], "labels": ["then", "else"], "op": "br"},
+            {"label": "then"},
+            {"args": ["a", "b"], "dest": "x", "op": "mul", "type": "int"},
+            {"labels": ["end"], "op": "jmp"},
+            {"label": "else"},
+            {"args": ["a", "b"], "dest": "y", "op": "mul", "type": "int"},
+            {"label": "end"},
+        ]
+        self.assertEqual(self.run_gvn(instrs), instrs)
+
+    def test_reassigned_variables_are_not_numbered(self):
+        instrs = [
+            {"args": ["a", "b"], "dest": "x", "op": "add", "type": "int"},
+            {"dest": "a", "op": "const", "type": "int", "value": 1},
+            {"args": ["a", "b"], "dest": "y", "op": "add", "type": "int"},
+        ]
+        self.assertEqual(self.run_gvn(instrs), instrs)
+
+    def test_constants_are_folded_across_blocks(self):
+        instrs = [
+            {"dest": "two", "op": "const", "type": "int", "value": 2},
+            {"label": "next"},
+            {"args": ["two", "two"], "dest": "four", "op": "mul", "type": "int"},
+            {"args": ["four"], "op": "print"},
+        ]
+        out = self.run_gvn(instrs)
+        self.assertEqual(out[2], {"dest": "four", "op": "const", "type": "int", "value": 4})
+
+    def test_signed_zeros_are_different_constants(self):
+        instrs = [
+            {"dest": "n", "op": "const", "type": "float", "value": -0.0},
+            {"label": "next"},
+            {"dest": "p", "op": "const", "type": "float", "value": 0.0},
+            {"dest": "z", "op": "const", "type": "float", "value": 0},
+            {"args": ["p"], "op": "print"},
+        ]
+        out = self.run_gvn(instrs)
+        self.assertEqual(out[2], instrs[2])
+        self.assertEqual(out[3], {"args": ["p"], "dest": "z", "op": "id", "type": "float"})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--test", action="store_true", help="Runs unit tests")
+    add_jobs_argument(parser)
+    add_format_arguments(parser)
+    args = parser.parse_args()
+    if args.test:
+        unittest.main(argv=["first-arg-is-ignored"])
+
+    # Functions are read, optimized and written out one at a time
+    stream_program(gvn_function, args)
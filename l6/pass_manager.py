@@ -0,0 +1,109 @@
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable
+
+# The LVN and TDCE passes live in the L3 directory, the analyses in L5, program I/O in common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "l3"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "l5"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+
+from cfg import form_basic_blocks
+from to_ssa import func_to_ssa
+from from_ssa import from_ssa
+from gvn import gvn_blocks
+from lvn import lvn_blocks
+from tdce import tdce_blocks
+from analysis_manager import AnalysisManager, ANALYSES, CFG_ANALYSES
+from bril_io import add_format_arguments, program_reader, program_writer
+
+# In-process pass manager: chains passes over each function's basic blocks,
+# so the program is only parsed and serialized once for the whole pipeline.
+# e.g. `bril2json < foo.bril | python pass_manager.py lvn,tdce,to_ssa,from_ssa`
+# Analyses (e.g. `dominators`) can also appear in the list, they are computed
+# through the function's analysis manager and kept until a pass invalidates them.
+
+
+@dataclass
+class Pass:
+    run: Callable  # (basic blocks, function, analysis manager) -> basic blocks
+    preserves: tuple[str, ...] = ()  # analyses that stay valid after the pass
+
+
+PASSES = {
+    "lvn": Pass(run=lambda bbs, func, am: lvn_blocks(bbs), preserves=CFG_ANALYSES),
+    "tdce": Pass(run=lambda bbs, func, am: tdce_blocks(bbs), preserves=CFG_ANALYSES),
+    "to_ssa": Pass(run=lambda bbs, func, am: func_to_ssa(bbs, func.get("args", []))),
+    "from_ssa": Pass(run=lambda bbs, func, am: from_ssa(bbs), preserves=CFG_ANALYSES),
+    "gvn": Pass(run=lambda bbs, func, am: gvn_blocks(bbs, am.get("dom_tree"), func.get("args", [])), preserves=CFG_ANALYSES),
+}
+
+
+def run_function_passes(func: dict, pass_names: list[str], timings: dict[str, float]) -> list[dict]:
+    """Runs the passes (and analyses) in order on a function and returns its new instructions,
+    accumulating the wall time spent in each of them into `timings`"""
+    am = AnalysisManager(form_basic_blocks(func))
+    for name in pass_names:
+        start = time.perf_counter()
+        if name in ANALYSES:
+            am.get(name)
+        else:
+            bbs = am.basic_blocks
+            # Passes may empty out blocks entirely (e.g. TDCE), drop those so the
+            # next pass sees the same blocks it would after re-parsing the program
+            new_bbs = [bb for bb in PASSES[name].run(bbs, func, am) if bb]
+            preserves = PASSES[name].preserves if len(new_bbs) == len(bbs) else ()
+            am.update(new_bbs, preserves)
+        timings[name] += time.perf_counter() - start
+    return [instr for bb in am.basic_blocks for instr in bb]
+
+
+def run_passes(program: dict, pass_names: list[str], timings: dict[str, float]) -> dict:
+    """Runs the passes (and analyses) in order on every function of the program (in place)"""
+    for func in program["functions"]:
+        func["instrs"] = run_function_passes(func, pass_names, timings)
+    return program
+
+
+def parse_pass_list(s: str) -> list[str]:
+    pass_names = [name.strip() for name in s.split(",") if name.strip()]
+    for name in pass_names:
+        if name not in PASSES and name not in ANALYSES:
+            choices = ", ".join([*PASSES, *ANALYSES])
+            raise argparse.ArgumentTypeError(f"unknown pass or analysis '{name}' (choose from {choices})")
+    return pass_names
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("passes", type=parse_pass_list, help="Comma-separated list of passes, e.g. lvn,tdce,to_ssa,from_ssa")
+    parser.add_argument("--time", action="store_true", help="Report per-pass wall time on stderr")
+    add_format_arguments(parser)
+    args = parser.parse_args()
+
+    # Functions are read, optimized and written out one at a time
+    timings = defaultdict(float)
+    reader = program_reader(sys.stdin, args.in_format)
+    writer = program_writer(sys.stdout, args.out_format)
+    functions = reader.functions()
+    timings["(load)"] = timings["(dump)"] = 0.0
+    while True:
+        start = time.perf_counter()
+        func = next(functions, None)
+        timings["(load)"] += time.perf_counter() - start
+        if func is None:
+            break
+        func["instrs"] = run_function_passes(func, args.passes, timings)
+        start = time.perf_counter()
+        writer.write(func)
+        timings["(dump)"] += time.perf_counter() - start
+    start = time.perf_counter()
+    writer.close(reader.extras)
+    timings["(dump)"] += time.perf_counter() - start
+
+    if args.time:
+        for name, seconds in timings.items():
+            print(f"{name}: {seconds * 1000:.3f} ms", file=sys.stderr)
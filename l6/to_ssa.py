@@ -1,8 +1,16 @@
-import json
+import argparse
+import os
 import sys
 from collections import Counter
 
-from cfg import form_basic_blocks, build_cfg, add_entry_block
+from cfg import form_basic_blocks, add_entry_block
+
+# The array-backed CFG representation is shared with L4/L5
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+
+from csr_cfg import build_csr_cfg
+from bril_io import add_format_arguments, stream_program
+from parallel import add_jobs_argument
 
 
 def _get_block_label(block: list[dict]) -> str:
@@ -43,7 +51,7 @@ def _get_all_dest_vars(blocks: list[list[[dict]]]) -> dict[str, str]:
 
 def to_ssa(blocks: list[list[[dict]]], func_args: list[dict]) -> list[list[dict]]:
     """Take a list of basic blocks and return the same blocks converted to SSA form"""
-    cfg = build_cfg(blocks)
+    cfg = build_csr_cfg(blocks)
     func_arg_to_type = {a["name"]: a["type"] for a in func_args}
     dest_vars = _get_all_dest_vars(blocks)
     ssa_blocks = _rename_vars(blocks)
@@ -81,7 +89,7 @@ def to_ssa(blocks: list[list[[dict]]], func_args: list[dict]) -> list[list[dict]
                 var = ".".join(parsed_var[1:-1])
                 if var not in seen_vars:
                     # Need a set instr for each successor
-                    for succ in cfg.get(num, []):
+                    for succ in cfg.successors(num):
                         # Ignore dummy exit node
                         if succ == len(ssa_blocks):
                             continue
@@ -94,14 +102,27 @@ def to_ssa(blocks: list[list[[dict]]], func_args: list[dict]) -> list[list[dict]
     return ssa_blocks
 
 
+def func_to_ssa(bbs: list[list[dict]], func_args: list[dict]) -> list[list[dict]]:
+    """Take a function's basic blocks, add a unique entry block, drop unlabeled
+    (unreachable) blocks and return the remaining blocks converted to SSA form"""
+    bbs = add_entry_block(bbs)
+    reachable_bbs = [bb for i, bb in enumerate(bbs) if ("label" in bb[0]) or (i == 0)]
+    return to_ssa(reachable_bbs, func_args)
+
+
+def ssa_function(func: dict) -> list[dict]:
+    """The instructions of `func` converted to SSA form"""
+    instrs = []
+    for bb in func_to_ssa(form_basic_blocks(func), func.get("args", [])):
+        instrs.extend(bb)
+    return instrs
+
+
 if __name__ == "__main__":
-    program = json.load(sys.stdin)
-    for func in program["functions"]:
-        bbs = form_basic_blocks(func)
-        bbs = add_entry_block(bbs)
-        reachable_bbs = [bb for i, bb in enumerate(bbs) if ("label" in bb[0]) or (i == 0)]
-        ssa = to_ssa(reachable_bbs, func.get("args", []))
-        func["instrs"] = []
-        for bb in ssa:
-            func["instrs"].extend(bb)
-    json.dump(program, sys.stdout, indent=2)
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    add_jobs_argument(parser)
+    add_format_arguments(parser)
+    args = parser.parse_args()
+
+    # Functions are read, converted and written out one at a time
+    stream_program(ssa_function, args)
\ No newline at end of file